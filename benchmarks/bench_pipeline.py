@@ -0,0 +1,194 @@
+"""
+bench_pipeline.py
+-----------------
+Offline throughput benchmark of the labeling pipeline.
+Builds a synthetic clustered dataset, runs it against the fake (or replay)
+LLM backend and reports clusters/sec, LLM calls per cluster and p50/p99
+latency per cluster and per LLM call.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pipeline --clusters 200 --docs 20
+    python -m benchmarks.bench_pipeline --mode pipeline --latency-ms 300 --token-error-rate 0.05
+    python -m benchmarks.bench_pipeline --backend replay --replay-path data/llm_recording.jsonl
+
+All settings of the pipeline (CLUSTER_SAMPLE_SIZE, CLUSTER_SAMPLING_MODE,
+LLM_BATCH_SIZE, LLM_PACKED_PROMPTS, ...) are read from the environment as usual.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+LABELS = ["Factuur", "Notulen", "Agenda", "Interne Memo", "Juridisch Contract", "Projectplanning"]
+FILLER = ("gemeente vergadering besluit datum bedrag artikel project overeenkomst "
+          "bijlage referentie afdeling verslag periode kosten planning").split()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of the cluster labeling pipeline")
+    parser.add_argument("--mode", choices=["infer", "pipeline"], default="infer",
+                        help="infer: infer_cluster_label per cluster; pipeline: process_single_cluster incl. CSV writes")
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--docs", type=int, default=10, help="documents per cluster")
+    parser.add_argument("--homogeneous", type=float, default=0.8,
+                        help="share of clusters whose documents all name the same label")
+    parser.add_argument("--duplicates", type=float, default=0.3,
+                        help="share of documents that are near-copies of another document of the cluster")
+    parser.add_argument("--doc-chars", type=int, default=3000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CLUSTER_WORKERS", "4")))
+    parser.add_argument("--backend", choices=["fake", "replay"], default="fake")
+    parser.add_argument("--replay-path", default="")
+    parser.add_argument("--latency-ms", type=float, default=800.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--embed-latency-ms", type=float, default=150.0)
+    parser.add_argument("--token-error-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--warm-cache", action="store_true",
+                        help="keep LLM/embedding caches of a previous run (default: fresh cache dir)")
+    parser.add_argument("--work-dir", default="", help="directory for dataset and caches (default: temp dir)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def configure_env(args, work_dir: str):
+    """Must run before any tools.* import: the modules read their config at import."""
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["LLM_REPLAY_PATH"] = args.replay_path
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.latency_sigma)
+    os.environ["FAKE_EMBED_LATENCY_MS"] = str(args.embed_latency_ms)
+    os.environ["FAKE_LLM_TOKEN_ERROR_RATE"] = str(args.token_error_rate)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    os.environ["OUTPUT_DIR"] = work_dir
+    os.environ["CACHE_DB_PATH"] = os.path.join(work_dir, "labeling_cache.sqlite")
+    os.environ["TABLE_NAME"] = "bench_assets"
+    os.environ["CLUSTER_WORKERS"] = str(args.workers)
+
+
+def build_dataset(args):
+    """Synthetic clusters; homogeneous ones name one label, mixed ones several."""
+    import pandas as pd
+
+    rng = random.Random(args.seed)
+    rows = []
+    asset_id = 0
+    for cluster_id in range(args.clusters):
+        homogeneous = rng.random() < args.homogeneous
+        base_label = rng.choice(LABELS)
+        cluster_docs = []
+        for d in range(args.docs):
+            if cluster_docs and rng.random() < args.duplicates:
+                # Near-copy: same template, different number
+                text = rng.choice(cluster_docs) + f" versie {d}"
+            else:
+                label = base_label if homogeneous else rng.choice(LABELS)
+                words = [rng.choice(FILLER) for _ in range(args.doc_chars // 8)]
+                text = f"{label} {cluster_id}-{d}\n" + " ".join(words)
+            cluster_docs.append(text)
+            rows.append({
+                "asset_id": asset_id,
+                "filename": f"doc_{cluster_id}_{d}.pdf",
+                "firstpagetxt": text[:args.doc_chars],
+                "cluster_id": cluster_id,
+            })
+            asset_id += 1
+    return pd.DataFrame(rows)
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run(args):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="label_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    if not args.warm_cache:
+        for name in os.listdir(work_dir):
+            if name.startswith("labeling_cache.sqlite") or name.startswith("bench_assets"):
+                os.remove(os.path.join(work_dir, name))
+    configure_env(args, work_dir)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    df = build_dataset(args)
+    csv_path = os.path.join(work_dir, "bench_assets_sample.csv")
+    df.to_csv(csv_path, index=False)
+
+    from tools.watsonx_utils import llm_backend
+
+    cluster_times = []
+    statuses = Counter()
+
+    def timed(fn, *fn_args):
+        start = time.perf_counter()
+        result = fn(*fn_args)
+        cluster_times.append((time.perf_counter() - start) * 1000)
+        return result
+
+    start = time.perf_counter()
+    if args.mode == "infer":
+        from tools.cluster_labeler import infer_cluster_label
+        frames = [group for _, group in df.groupby("cluster_id", sort=False)]
+        llm_backend.reset_stats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for result in executor.map(lambda frame: timed(infer_cluster_label, frame), frames):
+                statuses[result.get("status", "Error")] += 1
+    else:
+        import main
+        from tools.data_utils import get_data
+        data = get_data("csv", include_text=False)
+        targets = [int(cid) for cid in data["cluster_id"].unique()]
+        llm_backend.reset_stats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for result in executor.map(lambda cid: timed(main.process_single_cluster, data, cid, "csv"), targets):
+                statuses[result.get("status") or ("Error" if result.get("error") else "Skipped")] += 1
+    elapsed = time.perf_counter() - start
+
+    backend = llm_backend.stats()
+    report = {
+        "mode": args.mode,
+        "backend": backend["backend"],
+        "clusters": args.clusters,
+        "docs_per_cluster": args.docs,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 2),
+        "clusters_per_s": round(args.clusters / elapsed, 2) if elapsed else 0.0,
+        "llm_calls_per_cluster": round(backend["generate_calls"] / args.clusters, 2),
+        "prompts_per_cluster": round(backend["prompts"] / args.clusters, 2),
+        "embed_calls_per_cluster": round(backend["embed_calls"] / args.clusters, 2),
+        "llm_errors": backend["errors"],
+        "cluster_latency_p50_ms": round(percentile(cluster_times, 50), 1),
+        "cluster_latency_p99_ms": round(percentile(cluster_times, 99), 1),
+        "llm_latency_p50_ms": backend["latency_p50_ms"],
+        "llm_latency_p99_ms": backend["latency_p99_ms"],
+        "statuses": dict(statuses),
+        "work_dir": work_dir,
+    }
+    return report
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print("\n=== Labeling benchmark ===")
+    for key, value in report.items():
+        print(f"{key:>26}: {value}")
+
+
+if __name__ == "__main__":
+    main_cli()
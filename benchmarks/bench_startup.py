@@ -0,0 +1,116 @@
+"""
+bench_startup.py
+----------------
+Cold-start benchmark of the API service.
+Measures, in fresh interpreters:
+ - import time of main (module imports + app setup)
+ - time from launching uvicorn until /health answers
+ - the slowest top-level imports (python -X importtime)
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5 --json
+
+No watsonx credentials are needed: clients are created on the first labeling call.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start benchmark of the labeling API")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0, help="max seconds to wait for /health")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list:
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Direct imports of main (and main itself)
+        if depth <= 1:
+            rows.append((int(parts[1]) / 1e6, name.strip()))
+    return [{"module": name, "seconds": round(s, 3)} for s, name in sorted(rows, reverse=True)[:top]]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_health(timeout: float) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"/health did not answer within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run(args) -> dict:
+    imports = sorted(measure_import() for _ in range(args.runs))
+    health = sorted(measure_health(args.timeout) for _ in range(args.runs))
+    return {
+        "runs": args.runs,
+        "import_s_median": round(imports[len(imports) // 2], 3),
+        "import_s_max": round(imports[-1], 3),
+        "first_health_s_median": round(health[len(health) // 2], 3),
+        "first_health_s_max": round(health[-1], 3),
+        "slowest_imports": slowest_imports(args.top),
+    }
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print("\n=== Startup benchmark ===")
+    for key, value in report.items():
+        if key != "slowest_imports":
+            print(f"{key:>24}: {value}")
+    print("         slowest imports:")
+    for row in report["slowest_imports"]:
+        print(f"{row['seconds']:>24.3f}s {row['module']}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,18 +1,50 @@
 from fastapi import FastAPI, Query
 from fastapi import Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from typing import Optional
-from tools.data_utils import get_data,extend_mysql_schema,update_mysql_cluster_label,update_mysql_reset_labels,db_read_unlabeled_cluster,db_read_single_cluster,db_read_limit_cluster,update_mysql_reset_labels_limit
+from tools.data_utils import get_data,extend_mysql_schema,update_mysql_cluster_label,update_mysql_reset_labels,db_read_unlabeled_cluster,db_read_single_cluster,db_read_limit_cluster,update_mysql_reset_labels_limit,LabelWriteBuffer,append_label_journal,compact_label_journal,label_journal_size,backup_csv_dataset,reset_csv_labels,attach_csv_text,attach_db_text,csv_columns,iter_csv_chunks,db_stream_rows,db_table_columns,write_db_export,db_read_overview,is_dataset_cached,db_ping
 from tools.cluster_labeler import infer_cluster_label 
-import pandas as pd,shutil
+from tools.cluster_index import get_cluster_index
+from tools.cache_utils import llm_cache,embedding_cache
+from tools.dedup import fingerprint_index
+from tools.job_manager import job_manager
+from tools.token_budget import token_budget_stats
+from tools.watsonx_utils import prompt_batcher,llm_backend
+from tools.metrics import registry as metrics_registry,HTTP_REQUEST_SECONDS,CLUSTER_INFERENCE_SECONDS,CLUSTER_LABELS
+import pandas as pd
 from datetime import datetime
-import os,math,json
+import os,json,threading,queue,time,itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pydantic import BaseModel
 from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
 
 
+SERVICE_STARTED_AT = time.time()
+# Import slow, lazily loaded modules in the background once the server is up
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+def warm_up():
+    """Load sklearn (and the watsonx SDK) before the first labeling request needs them."""
+    start = time.perf_counter()
+    try:
+        import sklearn.metrics.pairwise  # noqa: F401
+        if llm_backend.name == "watsonx":
+            import ibm_watsonx_ai.foundation_models  # noqa: F401
+        print(f"🔥 Warm-up imports done in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"⚠️ Warm-up failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    print(f"🚀 Serving after {time.time() - SERVICE_STARTED_AT:.2f}s of app setup")
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Cluster Labeling & AI Inference API",
     description=(
         "AI-powered document cluster labeling workflow using watsonx foundation models. "
@@ -37,11 +69,63 @@ os.makedirs(DATA_DIR, exist_ok=True)
 DB_EXPORT_FILE = os.path.join(DATA_DIR, "core_assets_db_export.csv")
 
 DEFAULT_DATA_SOURCE=os.getenv("DEFAULT_DATA_SOURCE","csv")
-ENABLE_DATA_BACKUP=os.getenv("ENABLE_DATA_BACKUP","false")
+ENABLE_DATA_BACKUP=os.getenv("ENABLE_DATA_BACKUP","false").lower()=="true"
+# Number of clusters labeled in parallel by the multi-cluster endpoints
+CLUSTER_WORKERS=int(os.getenv("CLUSTER_WORKERS","4"))
+# Seconds between heartbeat events on streaming endpoints
+STREAM_HEARTBEAT_SECONDS=float(os.getenv("STREAM_HEARTBEAT_SECONDS","10"))
+
+# Serializes DataFrame mutations and DB/CSV writes between cluster workers
+# (reentrant: a buffered DB flush releases reservations while a worker holds it)
+df_lock = threading.RLock()
+# (source, cluster_id) currently being labeled, or labeled with the DB write
+# still waiting in a LabelWriteBuffer, so concurrent runs don't label twice
+inflight_clusters = set()
 
 # Mount the data directory so files can be served publicly
 app.mount("/files", StaticFiles(directory=DATA_DIR), name="files")
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Per-endpoint latency; routes are recorded by template (/jobs/{job_id})."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        )
+
+def _collect_gauges():
+    """Gauges read at scrape time from the caches, batcher and job manager."""
+    caches = {
+        "llm_classifications": llm_cache.stats(),
+        "label_embeddings": embedding_cache.stats(),
+        "document_fingerprints": fingerprint_index.stats(),
+    }
+    batching = prompt_batcher.stats()
+    jobs = job_manager.list()
+    return [
+        ("cache_entries", "Entries per persistent cache.",
+         [({"cache": name}, stats["entries"]) for name, stats in caches.items()]),
+        ("cache_hit_ratio", "Hit ratio per persistent cache since start.",
+         [({"cache": name}, stats["hit_ratio"]) for name, stats in caches.items()]),
+        ("llm_batch_avg_size", "Average prompts per batched generate call.", [({}, batching["avg_batch_size"])]),
+        ("llm_batch_queued", "Prompts waiting for the batcher.", [({}, batching["queued"])]),
+        ("labeling_jobs", "Known labeling jobs by status.",
+         [({"status": status}, sum(1 for job in jobs if job.status == status))
+          for status in ("queued", "running", "completed", "failed", "cancelled")]),
+    ]
+
+metrics_registry.register_collector(_collect_gauges)
+
 # --------------------------------------------------------------------
 # /data/read  →  Discover clusters and labeling status
 # --------------------------------------------------------------------
@@ -59,40 +143,34 @@ class ReadDataResponse(BaseModel):
     unlabeled_cluster_ids: List[int]
 
 @app.get("/data/read", response_model=ReadDataResponse, operation_id="read_data")
-async def read_data(source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")):
-    df = get_data(source)
-
-    if df.empty:
-        return {"error": "No data found in source"}
+def read_data(source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")):
+    if source == "db" and not is_dataset_cached("db", include_text=False):
+        # Aggregated by MySQL: no document rows (or labels_used blobs) are transferred
+        summary = db_read_overview()
+        if not summary["total_documents"]:
+            return {"error": "No data found in source"}
+        unlabeled_cluster_ids = summary["unlabeled_cluster_ids"]
+    else:
+        df = get_data(source, include_text=False)
 
-    total_docs = len(df)
-    total_clusters = df["cluster_id"].nunique()
-    labeled_clusters = df[df["cluster_label"].notnull()]["cluster_id"].nunique()
-    # print(len(labeled_clusters))
-    unlabeled_clusters = total_clusters - labeled_clusters
-    unlabeled_cluster_ids = (
-        df[df["cluster_label"].isnull()]["cluster_id"].dropna().unique().tolist()
-    )
-    # print(len(unlabeled_cluster_ids))
-    # print(unlabeled_clusters)
-    
-    coverage_percent = round((labeled_clusters / total_clusters) * 100, 2) if total_clusters else 0
+        if df.empty:
+            return {"error": "No data found in source"}
 
-    status_counts = (
-        df["label_status"].fillna("Unlabeled").value_counts().to_dict()
-        if "label_status" in df.columns else {}
-    )
+        # Counts come from the cluster index, which label writes keep current
+        index = get_cluster_index(df)
+        summary = index.summary()
+        unlabeled_cluster_ids = index.unlabeled_clusters()
 
     return ReadDataResponse(
         overview=Overview(
-            total_documents=total_docs,
-            total_clusters=total_clusters,
-            labeled_clusters=labeled_clusters,
-            unlabeled_clusters=unlabeled_clusters,
-            coverage_percent=coverage_percent,
+            total_documents=summary["total_documents"],
+            total_clusters=summary["total_clusters"],
+            labeled_clusters=summary["labeled_clusters"],
+            unlabeled_clusters=summary["unlabeled_clusters"],
+            coverage_percent=summary["coverage_percent"],
             data_source=source
         ),
-        doc_label_status_distribution=status_counts,
+        doc_label_status_distribution=summary["status_documents"],
         unlabeled_cluster_ids=unlabeled_cluster_ids
     )
 
@@ -104,7 +182,7 @@ class UnlabeledClustersResponse(BaseModel):
     response_model=UnlabeledClustersResponse,
     operation_id="get_unlabeled_clusters"
 )
-async def get_unlabeled_clusters(source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")):
+def get_unlabeled_clusters(source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")):
     """
     Returns only the list of unlabeled cluster IDs for lightweight operations.
     """
@@ -112,7 +190,7 @@ async def get_unlabeled_clusters(source: str = Query(DEFAULT_DATA_SOURCE, descri
         df = db_read_unlabeled_cluster()
         print(len(df))
     else:
-        df = get_data(source)
+        df = get_data(source, include_text=False)
     if df.empty:
         return {"error": "No data found in source"}
 
@@ -134,51 +212,88 @@ async def get_unlabeled_clusters(source: str = Query(DEFAULT_DATA_SOURCE, descri
 def process_single_cluster(
     df,
     cluster_id: int,
-    source: str
+    source: str,
+    label_writer: Optional[LabelWriteBuffer] = None
     # sample_size: Optional[int],
     # similarity_threshold: Optional[float],
 ):
 
-    # Validate cluster existence
-    if cluster_id not in df["cluster_id"].unique():
-        return {"error": True, "message": f"Cluster {cluster_id} not found"}
-
-    # Check if already labeled
-    existing_label = df.loc[df["cluster_id"] == cluster_id, "cluster_label"].iloc[0]
-    if pd.notnull(existing_label):
-        return {
-            "error": False,
-            "skip": True,
-            "message": f"Cluster {cluster_id} already labeled",
-            "cluster_id": cluster_id,
-            "cluster_label": existing_label
-        }
-
-    # Run inference
-    cluster_df = df[df["cluster_id"] == cluster_id]
-
-    result = infer_cluster_label(
-        cluster_df
-        # sample_size=sample_size,
-        # similarity_threshold=similarity_threshold,
-    )
-
-    label = result.get("cluster_label", "Unknown")
-    status = result.get("status", "Unknown")
-    labels_used_json = json.dumps(result.get("labels", []), ensure_ascii=False)
-    similarity = result.get("similarity_score", 0.0)
-
-    # Update dataframe
-    df.loc[df["cluster_id"] == cluster_id, "cluster_label"] = label
-    df.loc[df["cluster_id"] == cluster_id, "label_status"] = status
-    df.loc[df["cluster_id"] == cluster_id, "labels_used"] = labels_used_json
+    index = get_cluster_index(df)
+
+    with df_lock:
+        # Validate cluster existence
+        if cluster_id not in index:
+            return {"error": True, "message": f"Cluster {cluster_id} not found"}
+
+        # Check if already labeled
+        existing_label = index.label(cluster_id)
+        if pd.notnull(existing_label):
+            return {
+                "error": False,
+                "skip": True,
+                "message": f"Cluster {cluster_id} already labeled",
+                "cluster_id": cluster_id,
+                "cluster_label": existing_label
+            }
+
+        if (source, cluster_id) in inflight_clusters:
+            return {
+                "error": False,
+                "skip": True,
+                "message": f"Cluster {cluster_id} is already being labeled",
+                "cluster_id": cluster_id,
+                "cluster_label": None
+            }
+        inflight_clusters.add((source, cluster_id))
+
+        # Copy the slice so inference can run without holding the lock
+        cluster_df = index.cluster_frame(cluster_id).copy()
+
+    pending_write = False
+    try:
+        # Metadata-only frames (columnar CSV mode, two-phase DB reads) fetch text for sampled rows only
+        text_loader = None
+        if "firstpagetxt" not in cluster_df.columns:
+            text_loader = attach_db_text if source == "db" else attach_csv_text
+
+        # Run inference
+        with CLUSTER_INFERENCE_SECONDS.time():
+            result = infer_cluster_label(
+                cluster_df,
+                text_loader=text_loader
+                # sample_size=sample_size,
+                # similarity_threshold=similarity_threshold,
+            )
+
+        label = result.get("cluster_label", "Unknown")
+        status = result.get("status", "Unknown")
+        CLUSTER_LABELS.inc(status=status)
+        labels_used_json = json.dumps(result.get("labels", []), ensure_ascii=False)
+        similarity = result.get("similarity_score", 0.0)
+
+        with df_lock:
+            # Update dataframe (and index) rows of this cluster only
+            index.set_labels(cluster_id, {
+                "cluster_label": label,
+                "label_status": status,
+                "labels_used": labels_used_json,
+            })
+
+            # Save update (buffered when a multi-cluster run passes a writer)
+            if source == "db" and label_writer is not None:
+                # The reservation is released by release_flushed_clusters once the label is in MySQL
+                pending_write = True
+                label_writer.add(cluster_id, label, status, labels_used_json)
+            elif source == "db":
+                update_mysql_cluster_label(cluster_id, label, status, labels_used_json)
+            elif source == "csv":
+                # Append-only: the full CSV is only rewritten on compaction
+                append_label_journal(cluster_id, label, status, labels_used_json)
+    finally:
+        if not pending_write:
+            with df_lock:
+                inflight_clusters.discard((source, cluster_id))
 
-    # Save update
-    if source == "db":
-        update_mysql_cluster_label(cluster_id, label, status, labels_used_json)
-    elif source == "csv":
-        df.to_csv(RESULT_FILE, index=False)
-    
     return {
         "error": False,
         "skip": False,
@@ -188,6 +303,93 @@ def process_single_cluster(
         "similarity_score": similarity,
         "labels_used": result.get("labels", []),
     }
+def release_flushed_clusters(cluster_ids: list):
+    """LabelWriteBuffer callback: these DB labels were flushed (or failed), release them."""
+    with df_lock:
+        for cluster_id in cluster_ids:
+            inflight_clusters.discard(("db", cluster_id))
+
+def iter_process_clusters(df, target_clusters: list, source: str, label_writer=None, cancel_event=None):
+    """
+    Label clusters on a pool of CLUSTER_WORKERS threads and yield
+    (position in target_clusters, result) as each cluster finishes.
+    Clusters not started yet are skipped once cancel_event is set or the
+    caller stops iterating.
+    """
+    if not target_clusters:
+        return
+
+    workers = max(1, min(CLUSTER_WORKERS, len(target_clusters)))
+    print(f"Labeling {len(target_clusters)} clusters with {workers} workers")
+
+    def run(cid):
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        return process_single_cluster(df, cid, source, label_writer)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(run, cid): pos for pos, cid in enumerate(target_clusters)}
+        for future in as_completed(futures):
+            result = future.result()
+            if result is not None:
+                yield futures[future], result
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def process_clusters(df, target_clusters: list, source: str, on_result=None, cancel_event=None, collect: bool = True):
+    """
+    Label several clusters in parallel with a pool of CLUSTER_WORKERS threads.
+    For source='db' label writes are buffered and flushed in bulk.
+    on_result(result) is called as each cluster finishes; with collect=False
+    results are only handed to on_result and not kept.
+    Returns (results in the order of target_clusters, write report or None).
+    """
+    if not target_clusters:
+        return [], None
+
+    results = [None] * len(target_clusters) if collect else []
+    label_writer = LabelWriteBuffer(on_flushed=release_flushed_clusters) if source == "db" else None
+    try:
+        for pos, result in iter_process_clusters(df, target_clusters, source, label_writer, cancel_event):
+            if collect:
+                results[pos] = result
+            if on_result is not None:
+                on_result(result)
+    finally:
+        # Final flush also runs when a worker failed
+        if label_writer is not None:
+            label_writer.close()
+
+    # Cancelled runs leave gaps for clusters that never started
+    results = [r for r in results if r is not None]
+    return results, label_writer.report() if label_writer is not None else None
+
+def select_target_clusters(source: str, limit: int = 10, process_all: bool = False):
+    """
+    Load the data for a multi-cluster run and pick the unlabeled clusters:
+    the first `limit` ones, or all of them when limit is 0 (process_all).
+    Returns (df, target_clusters); df is None when no data was found.
+    """
+    with df_lock:
+        reserved = {cid for src, cid in inflight_clusters if src == source}
+    if source=="db":
+        if limit:
+            # Reserved clusters still read as unlabeled in MySQL; read enough to skip them
+            df = db_read_limit_cluster(limit + len(reserved))
+        else:
+            df = db_read_unlabeled_cluster()
+    else:
+        df = get_data(source, include_text=False)
+
+    if df.empty:
+        return None, []
+
+    unlabeled = [cid for cid in get_cluster_index(df).unlabeled_clusters() if cid not in reserved]
+    if limit and limit > 0:
+        return df, unlabeled[:limit]
+    return df, unlabeled
+
 # --------------------------------------------------------------------
 # /cluster/infersingle  →  Infer label for single cluster
 # --------------------------------------------------------------------
@@ -199,14 +401,13 @@ def backup_result_file():
     if not os.path.exists(RESULT_FILE):
         return None
 
+    # CSV plus its label journal: compacting here would rewrite the CSV on every run
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = RESULT_FILE.replace(".csv", f"_{timestamp}_backup.csv")
-    shutil.copy(RESULT_FILE, backup_path)
-
-    return backup_path
+    return backup_csv_dataset(backup_path)
 
 @app.get("/cluster/infersingle", operation_id="infer_labels_cluster_single")
-async def infer_labels_single(
+def infer_labels_single(
     cluster_id: int = Query(...)
     # sample_size: Optional[int] = None,
     # similarity_threshold: Optional[float] = None,
@@ -215,7 +416,7 @@ async def infer_labels_single(
     if source=="db":
         df = db_read_single_cluster(cluster_id)
     else:
-        df = get_data(source)
+        df = get_data(source, include_text=False)
     if df.empty:
         return {"error": "No data found in source"}
 
@@ -240,49 +441,29 @@ async def infer_labels_single(
 # /cluster/infer  →  Infer labels for clusters
 # --------------------------------------------------------------------
 @app.get("/cluster/infer", operation_id="infer_labels_cluster")
-async def infer_labels(
+def infer_labels(
     # cluster_id: Optional[int] = None,
     limit: int = 10,
     process_all: bool = False,
     source: str = Query(DEFAULT_DATA_SOURCE)
 ):
-    if source=="db":
-        if limit:
-            df = db_read_limit_cluster(limit)
-        elif process_all:
-            df = db_read_unlabeled_cluster()
-    else:
-        df = get_data(source)
+    if not (limit and limit > 0) and not process_all:
+        return {"error": "Set limit > 0 or process_all=true"}
 
-    if df.empty:
+    df, target_clusters = select_target_clusters(source, limit, process_all)
+    if df is None:
         return {"error": "No data found"}
 
     # Backup
     backup_path = backup_result_file()
 
-    # Determine clusters
-    unlabeled = df[df["cluster_label"].isnull()]["cluster_id"].unique().tolist()
-
-    # if cluster_id is not None:
-    #     target_clusters = [cluster_id]
-    if limit and limit > 0:
-        target_clusters = unlabeled[:limit]
-    elif process_all:
-        target_clusters = unlabeled
-
-    results = []
-    for cid in target_clusters:
-        res = process_single_cluster(
-            df, cid, source
-        )
-        results.append(res)
+    results, write_report = process_clusters(df, target_clusters, source)
 
     return {
         "message": f"Processed {len(target_clusters)} clusters",
         "backup_file": backup_path,
         "updated_file": RESULT_FILE,
-        "sample_size": sample_size,
-        "similarity_threshold": similarity_threshold,
+        "label_writes": write_report,
         "results": results,
     }
 
@@ -290,45 +471,193 @@ async def infer_labels(
 # /cluster/inferlimit  →  Infer labels for limited clusters
 # --------------------------------------------------------------------
 @app.get("/cluster/inferlimit", operation_id="infer_labels_cluster_limit")
-async def infer_labels_limit(
+def infer_labels_limit(
     limit: int = 10,
     source: str = Query(DEFAULT_DATA_SOURCE)
 ):
-    if source=="db":
-        if limit:
-            df = db_read_limit_cluster(limit)
-    else:
-        df = get_data(source)
-
-    if df.empty:
+    df, target_clusters = select_target_clusters(source, limit)
+    if df is None:
         return {"error": "No data found"}
 
     # Backup
     backup_path = backup_result_file()
 
-    # Determine clusters
-    unlabeled = df[df["cluster_label"].isnull()]["cluster_id"].unique().tolist()
-
-    # if cluster_id is not None:
-    #     target_clusters = [cluster_id]
-    if limit and limit > 0:
-        target_clusters = unlabeled[:limit]
-    else:
-        target_clusters = unlabeled
-    results = []
-    for cid in target_clusters:
-        res = process_single_cluster(
-            df, cid, source
-        )
-        results.append(res)
+    results, write_report = process_clusters(df, target_clusters, source)
 
     return {
         "message": f"Processed {len(target_clusters)} clusters",
         "backup_file": backup_path,
         "updated_file": RESULT_FILE,
+        "label_writes": write_report,
         "results": results,
     }
 
+# --------------------------------------------------------------------
+# /cluster/inferlimit/stream  →  Stream results of a limited run
+# --------------------------------------------------------------------
+def format_stream_event(event: str, data: dict, fmt: str) -> str:
+    """Encode one event as an NDJSON line or a server-sent event."""
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, **data}, ensure_ascii=False, default=str) + "\n"
+
+def stream_labeling_run(df, target_clusters: list, source: str, backup_path, fmt: str):
+    """
+    Run the clusters in a background thread and yield each result as soon
+    as it is done, plus heartbeat events with progress counters.
+    Stopping the iteration (client disconnect) cancels clusters not started yet.
+    """
+    events = queue.Queue()
+    cancel_event = threading.Event()
+    total = len(target_clusters)
+    started = time.monotonic()
+
+    def produce():
+        try:
+            _, write_report = process_clusters(
+                df, target_clusters, source,
+                on_result=lambda result: events.put(("result", result)),
+                cancel_event=cancel_event,
+                collect=False
+            )
+            events.put(("end", write_report))
+        except Exception as e:
+            events.put(("error", str(e)))
+
+    producer = threading.Thread(target=produce, name="labeling-stream", daemon=True)
+    producer.start()
+
+    completed = 0
+    try:
+        yield format_stream_event("start", {
+            "total": total,
+            "backup_file": backup_path,
+            "updated_file": RESULT_FILE,
+        }, fmt)
+        while True:
+            try:
+                kind, payload = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield format_stream_event("heartbeat", {
+                    "completed": completed,
+                    "total": total,
+                    "elapsed_seconds": round(time.monotonic() - started, 1),
+                }, fmt)
+                continue
+
+            if kind == "result":
+                completed += 1
+                yield format_stream_event("result", {
+                    "completed": completed,
+                    "total": total,
+                    "result": payload,
+                }, fmt)
+            elif kind == "error":
+                yield format_stream_event("error", {"completed": completed, "total": total, "message": payload}, fmt)
+                return
+            else:
+                yield format_stream_event("end", {
+                    "message": f"Processed {completed} clusters",
+                    "completed": completed,
+                    "total": total,
+                    "elapsed_seconds": round(time.monotonic() - started, 1),
+                    "label_writes": payload,
+                }, fmt)
+                return
+    finally:
+        cancel_event.set()
+
+@app.get("/cluster/inferlimit/stream", operation_id="infer_labels_cluster_limit_stream")
+def infer_labels_limit_stream(
+    limit: int = 10,
+    source: str = Query(DEFAULT_DATA_SOURCE),
+    format: str = Query("ndjson", description="Stream format: ndjson or sse")
+):
+    """
+    Streaming variant of /cluster/inferlimit: emits every cluster result as
+    soon as it is labeled, with periodic heartbeat/progress events.
+    """
+    df, target_clusters = select_target_clusters(source, limit)
+    if df is None:
+        return {"error": "No data found"}
+
+    backup_path = backup_result_file()
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        stream_labeling_run(df, target_clusters, source, backup_path, format),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# --------------------------------------------------------------------
+# /jobs  →  Asynchronous labeling runs (submit / poll / cancel)
+# --------------------------------------------------------------------
+def run_labeling_job(job, source: str, limit: int, cluster_id: Optional[int]):
+    """Job body: label the requested clusters and report progress on the job."""
+    if cluster_id is not None:
+        df = db_read_single_cluster(cluster_id) if source == "db" else get_data(source, include_text=False)
+        target_clusters = [cluster_id] if not df.empty else []
+    else:
+        df, target_clusters = select_target_clusters(source, limit)
+    job.set_total(len(target_clusters))
+    if not target_clusters:
+        return {"message": "No unlabeled clusters found"}
+
+    backup_path = backup_result_file()
+    results, write_report = process_clusters(
+        df, target_clusters, source,
+        on_result=job.add_result,
+        cancel_event=job.cancel_event
+    )
+    return {
+        "message": f"Processed {len(results)} of {len(target_clusters)} clusters",
+        "backup_file": backup_path,
+        "updated_file": RESULT_FILE,
+        "label_writes": write_report,
+    }
+
+@app.post("/jobs/infer", operation_id="submit_labeling_job")
+def submit_labeling_job(
+    limit: int = 10,
+    cluster_id: Optional[int] = None,
+    source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")
+):
+    """
+    Starts a labeling run in the background and returns its job id immediately.
+    Pass cluster_id for a single cluster, otherwise the next `limit` unlabeled clusters are labeled.
+    """
+    params = {"limit": limit, "cluster_id": cluster_id, "source": source}
+    job = job_manager.submit(
+        "infer", params,
+        lambda job: run_labeling_job(job, source, limit, cluster_id)
+    )
+    return {"job_id": job.job_id, "status": job.status, "poll_url": f"/jobs/{job.job_id}"}
+
+@app.get("/jobs", operation_id="list_labeling_jobs")
+def list_labeling_jobs():
+    """Lists recent labeling jobs without their per-cluster results."""
+    return {"jobs": [job.to_dict(include_results=False) for job in job_manager.list()]}
+
+@app.get("/jobs/{job_id}", operation_id="get_labeling_job")
+def get_labeling_job(
+    job_id: str,
+    offset: int = Query(0, description="Return results from this position on (for incremental polling)")
+):
+    """Returns status, progress counters and the (partial) results of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    return job.to_dict(offset=offset)
+
+@app.post("/jobs/{job_id}/cancel", operation_id="cancel_labeling_job")
+def cancel_labeling_job(job_id: str):
+    """Cancels a job; clusters already running finish, the rest are skipped."""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Job {job_id} not found"})
+    return {"job_id": job.job_id, "status": job.status, "cancel_requested": job.cancel_event.is_set()}
+
 # --------------------------------------------------------------------
 # Export CSV directly as file (safe for rendering/download)
 # --------------------------------------------------------------------
@@ -344,11 +673,18 @@ def get_export_file_url(request: Request, file_path: str):
     return download_url, None
 
 @app.get("/download/{filename}",operation_id="download_file")
-async def download_file(filename: str):
+def download_file(filename: str):
     file_path = os.path.join(DATA_DIR, filename)
 
     if not os.path.exists(file_path):
         return {"error": "File not found"}
+    # Pending journaled labels are merged into the download, not into the file
+    if file_path == RESULT_FILE and label_journal_size():
+        return StreamingResponse(
+            (chunk.to_csv(index=False, header=(i == 0)) for i, chunk in enumerate(iter_csv_chunks())),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
     # This sets the proper headers to force "Save As" dialog
     return FileResponse(
         path=file_path,
@@ -360,15 +696,73 @@ async def download_file(filename: str):
 # Export summarized JSON view for front-end rendering
 # --------------------------------------------------------------------
 
+def export_columns(source: str, columns: Optional[str], include_text: bool):
+    """
+    Validate the requested export columns against the source.
+    Returns (columns, error message or None); an empty selection is an error.
+    """
+    if source == "db":
+        available = db_table_columns()
+    else:
+        available = csv_columns()
+        available += [c for c in ["cluster_label", "label_status", "labels_used"] if c not in available]
+    if columns:
+        selected = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in selected if c not in available]
+        if unknown:
+            return None, f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(available)}"
+    else:
+        selected = list(available)
+    if not include_text:
+        selected = [c for c in selected if c != "firstpagetxt"]
+    if not selected:
+        return None, "No columns selected (firstpagetxt is excluded by include_text=false)"
+    return selected, None
+
+def stream_records(chunks, format: str):
+    """Encode DataFrame chunks as NDJSON lines or one incrementally written JSON document."""
+    if format == "json":
+        yield '{"records": ['
+    first = True
+    for chunk in chunks:
+        records = chunk.astype(object).where(chunk.notna(), None).to_dict(orient="records")
+        if not records:
+            continue
+        lines = [json.dumps(record, ensure_ascii=False, default=str) for record in records]
+        if format == "ndjson":
+            yield "\n".join(lines) + "\n"
+        else:
+            yield ("" if first else ",") + ",".join(lines)
+        first = False
+    if format == "json":
+        yield "]}"
+
 @app.get("/results/export", operation_id="export_results_csv")
-async def export_results(
+def export_results(
             request: Request,
-            format: str = Query("csv", description="Format: csv ,json(default)"),
-            source: str = Query(DEFAULT_DATA_SOURCE, description="Format: db,csv)")
+            format: str = Query("csv", description="Format: csv ,json(default), ndjson"),
+            source: str = Query(DEFAULT_DATA_SOURCE, description="Format: db,csv)"),
+            columns: Optional[str] = Query(None, description="json/ndjson: comma-separated columns (default: all)"),
+            include_text: bool = Query(True, description="json/ndjson: include the firstpagetxt column")
         ):
-    if not os.path.exists(RESULT_FILE):
+    if source == "csv" and not os.path.exists(RESULT_FILE):
         return {"error": "No result file found. Please run /cluster/infer first."}
 
+    if format in ("json", "ndjson"):
+        # Streamed chunk by chunk: memory stays at one chunk, not the whole table
+        selected, error = export_columns(source, columns, include_text)
+        if error:
+            return JSONResponse(status_code=400, content={"error": error})
+        if source == "db":
+            chunks = db_stream_rows(selected)
+        else:
+            chunks = iter_csv_chunks(selected)
+        # Read the first chunk up front so read errors still become HTTP errors
+        first = next(chunks, None)
+        chunks = itertools.chain([first] if first is not None else [], chunks)
+        media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+        return StreamingResponse(stream_records(chunks, format), media_type=media_type)
+
     if format == "csv":
         if source == "csv":
             download_url, error = get_export_file_url(request, RESULT_FILE)
@@ -379,68 +773,44 @@ async def export_results(
             "message": "File available for download"
         }
 
-    elif format == "json":
-        if source == "csv":
-            df = pd.read_csv(RESULT_FILE)
-        elif source == "db":
-            df = pd.read_csv(DB_EXPORT_FILE)
-        df = pd.read_csv(RESULT_FILE)
-        records = df.replace({math.nan: None}).to_dict(orient="records")
-        return JSONResponse(content={"records": records})
-
     else:
-        return {"error": "Unsupported format. Use 'csv' or 'json'."}
+        return {"error": "Unsupported format. Use 'csv', 'json' or 'ndjson'."}
     
 @app.get("/results/export/summary",operation_id="results_summary")
-async def export_summary( request: Request,source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db"),filter: Optional[str] = Query(None), sort: Optional[str] = Query(None)):
+def export_summary( request: Request,source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db"),filter: Optional[str] = Query(None), sort: Optional[str] = Query(None)):
     """
     Reads data and identifies which clusters have or lack labels.
     """
-    df = get_data(source)
+    df = get_data(source, include_text=False)
 
     if df.empty:
         return {"error": "No data found in source"}
     
-    if source == "db":
-        # fresh DB snapshot export
-        db_export_path = os.path.join(DATA_DIR, "core_assets_db_export.csv")
-        os.makedirs(DATA_DIR, exist_ok=True)
-        df.to_csv(db_export_path, index=False)
-        exported_file = db_export_path
-    else:
-        exported_file = RESULT_FILE
-
     for col in ["cluster_id", "cluster_label", "label_status"]:
         if col not in df.columns:
             return {"error": f"Missing required column: {col}"}
 
-    total_clusters = int(df["cluster_id"].nunique())
-    total_documents = len(df)
-    labeled_clusters = int(df[df["cluster_label"].notnull()]["cluster_id"].nunique())
-    unlabeled_clusters = total_clusters - labeled_clusters
-    coverage_percent = round((labeled_clusters / total_clusters) * 100, 2)
+    if source == "db":
+        # DB snapshot export, rewritten only after labels changed
+        write_db_export(df, DB_EXPORT_FILE)
+        exported_file = DB_EXPORT_FILE
+    else:
+        exported_file = RESULT_FILE
+
+    # Aggregates come from the cluster index in O(clusters), not from the rows
+    counts = get_cluster_index(df).summary()
+    total_clusters = counts["total_clusters"]
 
     # 1️⃣ Summary by status
-    status_counts = (
-        df["label_status"].fillna("Unlabeled").value_counts().to_dict()
-    )
-    by_status = [{"status": k, "clusters": v} for k, v in status_counts.items()]
+    by_status = [{"status": k, "clusters": v} for k, v in counts["status_documents"].items()]
 
     # 2️⃣ Group by label
-    label_groups = {}
-    labeled_df = df[df["cluster_label"].notnull()]
-    grouped = labeled_df.groupby("cluster_label")["cluster_id"].unique()
-
-    for label, clusters in grouped.items():
-        label_groups[label] = list(map(int, clusters))
+    label_groups = counts["label_clusters"]
 
     # optional filtering/sorting
     if sort == "label_count":
         label_groups = dict(sorted(label_groups.items(), key=lambda x: len(x[1]), reverse=True))
 
-    if filter == "manual":
-        df = df[df["label_status"].str.contains("Manual", na=False)]
-
     by_label = [
         {"label": label, "cluster_count": len(clusters), "cluster_ids": clusters}
         for label, clusters in label_groups.items()
@@ -457,10 +827,10 @@ async def export_summary( request: Request,source: str = Query(DEFAULT_DATA_SOUR
     summary = {
         "overview": {
             "total_clusters": total_clusters,
-            "total_documents": total_documents,
-            "labeled_clusters": labeled_clusters,
-            "unlabeled_clusters": unlabeled_clusters,
-            "coverage_percent": coverage_percent,
+            "total_documents": counts["total_documents"],
+            "labeled_clusters": counts["labeled_clusters"],
+            "unlabeled_clusters": counts["unlabeled_clusters"],
+            "coverage_percent": counts["coverage_percent"],
             "dominant_label": dominant_label,
             "dominant_label_ratio": dominant_label_ratio
         },
@@ -471,6 +841,79 @@ async def export_summary( request: Request,source: str = Query(DEFAULT_DATA_SOUR
 
     return JSONResponse(content=summary)
 
+# --------------------------------------------------------------------
+# /cache/stats  →  Cache counters
+# --------------------------------------------------------------------
+@app.get("/cache/stats",operation_id="cache_stats")
+async def cache_stats():
+    """
+    Returns hit/miss counters and sizes of the persistent caches.
+    """
+    return {
+        "llm_classifications": llm_cache.stats(),
+        "label_embeddings": embedding_cache.stats(),
+        "document_fingerprints": fingerprint_index.stats(),
+    }
+
+# --------------------------------------------------------------------
+# /llm/token-budget  →  Token budget calibration and retry counters
+# --------------------------------------------------------------------
+@app.get("/llm/token-budget",operation_id="token_budget_stats")
+async def token_budget():
+    """
+    Returns the calibrated chars-per-token estimate, learned input limit and
+    up-front trim / token-limit retry counters per model.
+    """
+    return {"models": token_budget_stats()}
+
+# --------------------------------------------------------------------
+# /metrics  →  Prometheus scrape endpoint
+# --------------------------------------------------------------------
+@app.get("/metrics",operation_id="metrics",include_in_schema=False)
+async def metrics():
+    """
+    Per-stage latency histograms (DB, LLM, embeddings, label writes, API
+    requests), token-limit retries, labeling outcomes and cache gauges in the
+    Prometheus text format.
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# --------------------------------------------------------------------
+# /health, /ready  →  Liveness and readiness probes (no watsonx calls)
+# --------------------------------------------------------------------
+@app.get("/health",operation_id="health",include_in_schema=False)
+async def health():
+    """Liveness: the process serves requests."""
+    return {"status": "ok", "uptime_seconds": round(time.time() - SERVICE_STARTED_AT, 1)}
+
+@app.get("/ready",operation_id="ready",include_in_schema=False)
+def ready(source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db")):
+    """
+    Readiness: the data source is reachable. The LLM backend is only
+    reported; its clients are created on the first labeling call.
+    """
+    if source == "db":
+        data_ready = db_ping()
+    else:
+        data_ready = os.path.exists(RESULT_FILE)
+    body = {
+        "status": "ready" if data_ready else "not_ready",
+        "data_source": {"source": source, "ready": data_ready},
+        "llm_backend": llm_backend.status(),
+    }
+    return JSONResponse(status_code=200 if data_ready else 503, content=body)
+
+# --------------------------------------------------------------------
+# /llm/batching  →  Prompt batching counters
+# --------------------------------------------------------------------
+@app.get("/llm/batching",operation_id="llm_batching_stats")
+async def llm_batching():
+    """
+    Returns how many prompts were sent per generate call and how often a
+    failed batch fell back to single prompts.
+    """
+    return prompt_batcher.stats()
+
 # --------------------------------------------------------------------
 # /data/extend-schema  → Extend DB schema
 # --------------------------------------------------------------------
@@ -485,12 +928,24 @@ def extend_schema():
     except Exception as e:
         return {"error": str(e)}
 
+# --------------------------------------------------------------------
+# /data/compact  →  Merge the CSV label journal into the result file
+# --------------------------------------------------------------------
+@app.post("/data/compact",operation_id="compact_label_journal")
+def compact_labels():
+    """
+    Merges journaled cluster labels into the CSV result file.
+    """
+    with df_lock:
+        merged = compact_label_journal()
+    return {"message": f"Compacted {merged} journaled clusters", "file_source": RESULT_FILE}
+
 # --------------------------------------------------------------------
 # /data/reset  →  Reset all labels in data source
 # --------------------------------------------------------------------
 
 @app.post("/data/reset",operation_id="reset_labels")
-async def reset_labels(
+def reset_labels(
     source: str = Query(DEFAULT_DATA_SOURCE, description="Data source: csv or db"),
     confirm: bool = Query(False, description="Must be true to perform reset")
 ):
@@ -499,31 +954,23 @@ async def reset_labels(
 
     # Save changes
     if source == "csv":
-        df = get_data(source)
+        df = get_data(source, include_text=False)
         if df.empty:
             return {"error": "No data found in source"}
-        # Ensure columns exist
-        for col in ["cluster_label", "label_status", "labels_used"]:
-            if col not in df.columns:
-                df[col] = None
 
         # Create backup
         backup_path = backup_result_file()
 
         # Reset the 3 label columns
-        df["cluster_label"] = None
-        df["label_status"] = None
-        df["labels_used"] = None
-
-        df.to_csv(RESULT_FILE, index=False)
-        print(f"Reset CSV file: {RESULT_FILE}")
+        with df_lock:
+            total_rows = reset_csv_labels()
     else:
         update_mysql_reset_labels()
         print("Reset DB table")
 
     return JSONResponse(content={
         "message": f"Reset completed for {source.upper()}",
-        "total_rows": len(df) if source == "csv" else "N/A",
+        "total_rows": total_rows if source == "csv" else "N/A",
         "backup_file": backup_path if source == "csv" else None,
         "columns_reset": ["cluster_label", "label_status", "labels_used"],
         "file_source": RESULT_FILE if source == "csv" else "MySQL DB"
@@ -531,7 +978,7 @@ async def reset_labels(
 
 
 @app.post("/data/resetlimit",operation_id="reset_labels_limit")
-async def reset_labels_limit(
+def reset_labels_limit(
     limit: int = 10,
     confirm: bool = Query(False, description="Must be true to perform reset")
 ):
@@ -0,0 +1,225 @@
+"""
+cache_utils.py
+--------------
+Disk-backed caches for the labeling pipeline.
+Supports:
+ - SQLite key/value store with LRU eviction and hit/miss counters
+ - fails open: SQLite errors are logged and count as misses
+ - optional in-process LRU layer in front of the SQLite table
+ - LLM document classification cache (content-addressed)
+ - label embedding cache (embedding model + normalized label)
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+CACHE_DIR = os.getenv("OUTPUT_DIR", "./data")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(CACHE_DIR, "labeling_cache.sqlite"))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "5000"))
+# last_used of cache hits is written in batches of this many keys (or with the next put)
+CACHE_TOUCH_BATCH = int(os.getenv("CACHE_TOUCH_BATCH", "100"))
+
+
+def make_key(*parts) -> str:
+    """Stable sha256 key over any number of string parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    """
+    Small persistent key/value cache stored in one SQLite table.
+    Values are JSON encoded. When the table grows beyond max_entries the
+    least recently used 10% of the entries are evicted.
+    With memory_entries > 0 the most recently used values are also kept
+    in process, so repeated lookups never touch SQLite.
+    Hits only queue their last_used update; queued updates are written
+    together with the next put, eviction or a full batch.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int, enabled: bool = True, memory_entries: int = 0):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._touched = {}  # key -> last_used not yet written
+        self._lock = threading.Lock()
+        self._conn = None
+        self._count = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table}(last_used)"
+            )
+            conn.commit()
+            self._count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _failed(self, action: str, error: Exception):
+        """Log a SQLite error; the cache then behaves as a miss / no-op (caller holds the lock)."""
+        self.errors += 1
+        print(f"⚠️ Cache '{self.table}' {action} failed: {error}")
+
+    def _rollback(self):
+        try:
+            if self._conn is not None:
+                self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _flush_touched(self, conn):
+        """Write queued last_used updates (caller holds the lock and commits)."""
+        if self._touched:
+            conn.executemany(
+                f"UPDATE {self.table} SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()]
+            )
+        self._touched.clear()
+
+    def get(self, key: str):
+        """Return the cached value or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            try:
+                conn = self._connect()
+                row = conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+            except sqlite3.Error as e:
+                self._failed("lookup", e)
+                self.misses += 1
+                return None
+            value = json.loads(row[0])
+            self._touched[key] = time.time()
+            if len(self._touched) >= CACHE_TOUCH_BATCH:
+                try:
+                    self._flush_touched(conn)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    # Only recency is lost; the hit still counts
+                    self._failed("last_used update", e)
+                    self._rollback()
+            self.hits += 1
+            self._remember(key, value)
+            return value
+
+    def put(self, key: str, value):
+        """Store a JSON serializable value."""
+        if not self.enabled:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                exists = conn.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, last_used) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), time.time())
+                )
+                self._touched.pop(key, None)
+                self._flush_touched(conn)
+                count = self._count + (0 if exists else 1)
+                if count > self.max_entries:
+                    count = self._evict(conn)
+                conn.commit()
+                self._count = count
+            except sqlite3.Error as e:
+                self._failed("store", e)
+                self._rollback()
+                return
+            self._remember(key, value)
+
+    def _remember(self, key: str, value):
+        """Keep value in the in-process LRU layer (caller holds the lock)."""
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, conn) -> int:
+        """Drop the least recently used entries (caller holds the lock); returns the new count."""
+        drop = max(1, self.max_entries // 10)
+        conn.execute(f"""
+            DELETE FROM {self.table} WHERE key IN (
+                SELECT key FROM {self.table} ORDER BY last_used ASC LIMIT ?
+            )
+        """, (drop,))
+        self.evictions += drop
+        print(f"🧹 Cache '{self.table}' evicted {drop} entries")
+        return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+            self._count = 0
+            self._memory.clear()
+            self._touched.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "memory_entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# -----------------------------------------------------------------
+# SHARED CACHES
+# -----------------------------------------------------------------
+llm_cache = SQLiteCache(CACHE_DB_PATH, "llm_classifications", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_ENABLED)
+embedding_cache = SQLiteCache(
+    CACHE_DB_PATH, "label_embeddings", EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_ENABLED, memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES
+)
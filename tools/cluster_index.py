@@ -0,0 +1,147 @@
+"""
+cluster_index.py
+----------------
+Per-DataFrame index of clusters for the labeling pipeline.
+Supports:
+ - cluster_id → row positions, built once per loaded frame
+ - per-cluster label state (label / status of the cluster)
+ - label updates in O(rows in cluster) instead of full-frame masks
+ - label summary (coverage, status and label distribution) in O(clusters)
+"""
+
+import threading
+import weakref
+from collections import Counter
+import pandas as pd
+
+LABEL_COLUMNS = ["cluster_label", "label_status", "labels_used"]
+
+
+class ClusterIndex:
+    """
+    Maps every cluster_id of a DataFrame to its row positions and keeps the
+    cluster label state next to it. All label writes that go through
+    set_labels() keep frame and index in sync.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df_ref = weakref.ref(df)
+        # sort=False keeps clusters in order of first appearance, like unique()
+        groups = df.groupby("cluster_id", sort=False).indices
+        self.positions = {_scalar(cid): rows for cid, rows in groups.items()}
+        labels = df["cluster_label"].to_numpy() if "cluster_label" in df.columns else None
+        statuses = df["label_status"].to_numpy() if "label_status" in df.columns else None
+        self.labels = {}
+        self.statuses = {}
+        for cid, rows in self.positions.items():
+            first = rows[0]
+            self.labels[cid] = _value(labels[first]) if labels is not None else None
+            self.statuses[cid] = _value(statuses[first]) if statuses is not None else None
+        # Rows without a cluster never get labels, count their statuses once
+        orphans = df["cluster_id"].isna().to_numpy()
+        orphan_statuses = [_value(s) for s in statuses[orphans]] if statuses is not None else [None] * int(orphans.sum())
+        self.orphan_statuses = Counter("Unlabeled" if s is None else s for s in orphan_statuses)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self._df_ref()
+
+    def __contains__(self, cluster_id) -> bool:
+        return cluster_id in self.positions
+
+    def label(self, cluster_id):
+        return self.labels.get(cluster_id)
+
+    def unlabeled_clusters(self) -> list:
+        return [cid for cid, label in self.labels.items() if label is None]
+
+    def summary(self) -> dict:
+        """
+        Label summary of the frame from the index alone:
+        documents per label_status (None → "Unlabeled", most frequent first)
+        and cluster ids per label (labels sorted, clusters in frame order).
+        """
+        status_docs = Counter(self.orphan_statuses)
+        label_clusters = {}
+        for cid, rows in self.positions.items():
+            status = self.statuses[cid]
+            status_docs["Unlabeled" if status is None else status] += len(rows)
+            label = self.labels[cid]
+            if label is not None:
+                label_clusters.setdefault(label, []).append(cid)
+        total_clusters = len(self.positions)
+        labeled = sum(len(clusters) for clusters in label_clusters.values())
+        return {
+            "total_documents": len(self.df),
+            "total_clusters": total_clusters,
+            "labeled_clusters": labeled,
+            "unlabeled_clusters": total_clusters - labeled,
+            "coverage_percent": round(labeled / total_clusters * 100, 2) if total_clusters else 0,
+            "status_documents": dict(status_docs.most_common()),
+            "label_clusters": {label: label_clusters[label] for label in sorted(label_clusters)},
+        }
+
+    def cluster_frame(self, cluster_id) -> pd.DataFrame:
+        """Rows of one cluster (original index labels kept)."""
+        return self.df.iloc[self.positions[cluster_id]]
+
+    def set_labels(self, cluster_id, values: dict):
+        """Write label columns for one cluster into the frame and the index."""
+        rows = self.positions.get(cluster_id)
+        if rows is None:
+            return
+        df = self.df
+        for col in LABEL_COLUMNS:
+            if col not in values:
+                continue
+            if df[col].dtype != object:
+                df[col] = df[col].astype(object)
+            df.iloc[rows, df.columns.get_loc(col)] = values[col]
+        if "cluster_label" in values:
+            self.labels[cluster_id] = _value(values["cluster_label"])
+        if "label_status" in values:
+            self.statuses[cluster_id] = _value(values["label_status"])
+
+    def reset_labels(self):
+        """Index side of resetting all label columns."""
+        for cid in self.labels:
+            self.labels[cid] = None
+            self.statuses[cid] = None
+
+
+def _scalar(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def _value(value):
+    """Normalize NaN/None to None and numpy scalars to Python values."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return _scalar(value)
+
+
+# -----------------------------------------------------------------
+# INDEX REGISTRY (one index per live DataFrame)
+# -----------------------------------------------------------------
+_indexes = {}  # id(df) -> ClusterIndex
+_indexes_lock = threading.Lock()
+
+
+def get_cluster_index(df: pd.DataFrame) -> ClusterIndex:
+    """Return the index of df, building it on first use."""
+    key = id(df)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None and index.df is df:
+            return index
+        index = ClusterIndex(df)
+        _indexes[key] = index
+        weakref.finalize(df, _indexes.pop, key, None)
+        return index
+
+
+def find_cluster_index(df: pd.DataFrame):
+    """Return the index of df if one was built, without building it."""
+    with _indexes_lock:
+        index = _indexes.get(id(df))
+        return index if index is not None and index.df is df else None
@@ -1,31 +1,110 @@
-import numpy as np,os
-from tools.watsonx_utils import wx_embeddings,inference_llm_dutch
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np,os,json
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from tools.watsonx_utils import wx_embeddings,inference_llm_dutch,inference_llm_dutch_packed,wx_llm_model_id,wx_embedding_model,DUTCH_PROMPT_TEMPLATE,PACKED_DUTCH_PROMPT_TEMPLATE,generate_params
+from tools.token_budget import get_token_budget,is_token_limit_error
+from tools.cache_utils import llm_cache,embedding_cache,make_key
+from tools.dedup import DEDUP_ENABLED,DEDUP_CANDIDATE_POOL,simhash,is_near_duplicate,fingerprint_index
+from tools.metrics import DOCUMENT_CLASSIFICATIONS,LLM_TOKEN_LIMIT_RETRIES,LLM_TOKEN_LIMIT_FAILURES,EMBEDDING_CALL_SECONDS
 from dotenv import load_dotenv
 
 load_dotenv()  # load .env vars once
 
 MAX_CHARS = int(os.getenv("LLM_INPUT_MAX_CHARS", 40000))
+# Max number of sampled documents of one cluster classified in parallel
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+# fixed: classify the whole sample, sequential (opt-in): classify in waves and stop once the vote is settled
+CLUSTER_SAMPLING_MODE = os.getenv("CLUSTER_SAMPLING_MODE", "fixed").lower()
+# Sample size ambiguous clusters escalate to in sequential mode (0 = twice CLUSTER_SAMPLE_SIZE)
+CLUSTER_MAX_SAMPLE_SIZE = int(os.getenv("CLUSTER_MAX_SAMPLE_SIZE", 0))
+MAJORITY_THRESHOLD = 0.6
+# Classify the documents of a wave in one packed prompt instead of one call each
+LLM_PACKED_PROMPTS = os.getenv("LLM_PACKED_PROMPTS", "false").lower() == "true"
+# Max chars per document inside a packed prompt
+LLM_PACKED_DOC_CHARS = int(os.getenv("LLM_PACKED_DOC_CHARS", 8000))
+# "Document N:" header and separator around each packed snippet
+PACKED_DOC_HEADER_CHARS = 16
+
+# Any change to model, prompt or generation params yields new cache keys
+LLM_CACHE_NAMESPACE = make_key(wx_llm_model_id, DUTCH_PROMPT_TEMPLATE, json.dumps(generate_params, sort_keys=True))
+LLM_PACKED_CACHE_NAMESPACE = make_key(wx_llm_model_id, PACKED_DUTCH_PROMPT_TEMPLATE, json.dumps(generate_params, sort_keys=True), LLM_PACKED_DOC_CHARS)
+
+
+def lookup_classification(entries: list):
+    """
+    Cached classification for (namespace, snippet) entries, each snippet
+    being the text sent under that namespace: exact match first, then a
+    near-duplicate. Returns (classification or None, near_duplicate,
+    fingerprint of the last entry's snippet, for storing a new result).
+    """
+    for namespace, snippet in entries:
+        cached = llm_cache.get(make_key(namespace, snippet))
+        if cached is not None:
+            return cached, False, 0
+    fingerprints = {}
+    for namespace, snippet in entries:
+        if snippet not in fingerprints:
+            fingerprints[snippet] = simhash(snippet) if DEDUP_ENABLED else 0
+        near_duplicate = fingerprint_index.get(namespace, fingerprints[snippet])
+        if near_duplicate is not None:
+            return near_duplicate, True, fingerprints[snippet]
+    return None, False, fingerprints[entries[-1][1]]
+
+
+def packed_group_size(count: int) -> int:
+    """
+    Most documents (at most count) whose LLM_PACKED_DOC_CHARS snippets and
+    answers fit one packed prompt; 1 means packing does not fit at all.
+    """
+    budget = get_token_budget(wx_llm_model_id)
+    for size in range(count, 1, -1):
+        share = budget.snippet_chars(
+            len(PACKED_DUTCH_PROMPT_TEMPLATE) + size * PACKED_DOC_HEADER_CHARS,
+            budget.max_new_tokens * size,
+        )
+        if share is None or share >= size * LLM_PACKED_DOC_CHARS:
+            return size
+    return 1
+
 
 def process_text(first_page_text: str, filename: str = "unknown.pdf"):
     """
-    Try LLM with shrinking logic for token-limit errors.
-    Always return a result object.
+    Try LLM with the snippet trimmed to the model's token budget up front.
+    Token-limit errors still fall back to shrinking and retrying.
+    Always return a result object (token_retries = failed token-limit calls).
     If any error occurs, return Unknown + actual error message.
     """
     if not first_page_text or len(first_page_text.strip()) < 100:
-        return {
+        result = {
             "filename": filename,
             "document_label": "Unknown",
             "explanation": "Geen tekst beschikbaar voor analyse (first_page_text is None of leeg).",
             "status": "Error",
         }
+        DOCUMENT_CLASSIFICATIONS.inc(source="no_text")
+        return result
     snippet = first_page_text[:MAX_CHARS]
     MIN_LIMIT = 8000
 
+    # Reuse a previous classification of the same or a near-identical snippet (templates, versions)
+    cache_key = make_key(LLM_CACHE_NAMESPACE, snippet)
+    cached, near_duplicate, fingerprint = lookup_classification([(LLM_CACHE_NAMESPACE, snippet)])
+    if cached is not None:
+        result = {"filename": filename, **cached, "status": "OK", "token_retries": 0}
+        if near_duplicate:
+            result["near_duplicate"] = True
+        DOCUMENT_CLASSIFICATIONS.inc(source="near_duplicate" if near_duplicate else "cache")
+        return result
+
+    # Trim to the calibrated budget so the first request already fits
+    budget = get_token_budget(wx_llm_model_id)
+    prompt_overhead = len(DUTCH_PROMPT_TEMPLATE)
+    to_send = budget.fit(snippet, prompt_overhead)
+    token_retries = 0
+
     while True:
         try:
-            result = inference_llm_dutch(snippet)
+            result = inference_llm_dutch(to_send)
             # success → break loop
             break
 
@@ -33,44 +112,158 @@ def process_text(first_page_text: str, filename: str = "unknown.pdf"):
             error_msg = str(e)
 
             # detect token limit problems
-            msg = error_msg.lower()
-            if "token" in msg or "input tokens" in msg or "exceed" in msg:
-                new_len = int(len(snippet) * 0.5)
+            if is_token_limit_error(error_msg):
+                token_retries += 1
+                LLM_TOKEN_LIMIT_RETRIES.inc()
+                # Fallback: learn from the error, else halve the snippet
+                if budget.observe_limit_error(error_msg, prompt_overhead + len(to_send)):
+                    new_len = min(len(budget.fit(to_send, prompt_overhead)), int(len(to_send) * 0.9))
+                else:
+                    new_len = int(len(to_send) * 0.5)
 
                 if new_len < MIN_LIMIT:
+                    budget.record_failure()
+                    LLM_TOKEN_LIMIT_FAILURES.inc()
+                    DOCUMENT_CLASSIFICATIONS.inc(source="error")
                     # return the actual WatsonX error
                     return {
                         "filename": filename,
                         "document_label": "error",
                         "explanation": error_msg,
                         "status": "Error",
+                        "token_retries": token_retries,
                     }
 
                 print(f"⚠️ Token limit exceeded. Retrying with smaller size: {new_len}")
-                snippet = snippet[:new_len]
+                to_send = to_send[:new_len]
                 continue
 
             # non-token-limit error → return actual error
+            DOCUMENT_CLASSIFICATIONS.inc(source="error")
             return {
                 "filename": filename,
                 "document_label": "error",
                 "explanation": error_msg,
                 "status": "Error",
+                "token_retries": token_retries,
             }
 
     # successful LLM output
-    return {
-        "filename": filename,
+    classification = {
         "document_label": result.get("label", "Unknown").strip(),
         "explanation": result.get("explanation", "").strip(),
-        "status": "OK",
     }
+    # Unparseable responses are not cached so they get another try
+    if "label" in result:
+        llm_cache.put(cache_key, classification)
+        fingerprint_index.put(LLM_CACHE_NAMESPACE, fingerprint, classification)
+    DOCUMENT_CLASSIFICATIONS.inc(source="llm")
+
+    return {"filename": filename, **classification, "status": "OK", "token_retries": token_retries}
 
 
-def infer_cluster_label(cluster_df,  sample_size: int = None,similarity_threshold: float = None):
+def process_texts_packed(texts: list, filenames: list) -> list:
+    """
+    Classify several documents of one cluster with one packed prompt.
+    Every document is sent as its first LLM_PACKED_DOC_CHARS chars, so the
+    cached result always belongs to the same text; when the token budget
+    cannot hold them all, the documents are split over several packed prompts.
+    Cached documents are answered from the cache; documents the packed answer
+    cannot be mapped to (or any error) fall back to process_text.
+    Returns one result object per document, in input order.
+    """
+    results = [None] * len(texts)
+    pending = []  # (position, packed snippet, fingerprint)
+    for pos, (text, filename) in enumerate(zip(texts, filenames)):
+        if not text or len(text.strip()) < 100:
+            results[pos] = process_text(text, filename)
+            continue
+        snippet = text[:MAX_CHARS]
+        packed_snippet = snippet[:LLM_PACKED_DOC_CHARS]
+        # A single-document classification is as good as a packed one
+        cached, near_duplicate, fingerprint = lookup_classification(
+            [(LLM_CACHE_NAMESPACE, snippet), (LLM_PACKED_CACHE_NAMESPACE, packed_snippet)]
+        )
+        if cached is not None:
+            results[pos] = {"filename": filename, **cached, "status": "OK", "token_retries": 0}
+            if near_duplicate:
+                results[pos]["near_duplicate"] = True
+            DOCUMENT_CLASSIFICATIONS.inc(source="near_duplicate" if near_duplicate else "cache")
+            continue
+        pending.append((pos, packed_snippet, fingerprint))
+
+    unpacked = []
+    group_size = packed_group_size(len(pending)) if len(pending) > 1 else 1
+    for start in range(0, len(pending), group_size):
+        group = pending[start:start + group_size]
+        items = None
+        if len(group) > 1:
+            try:
+                items = inference_llm_dutch_packed([snippet for _, snippet, _ in group])
+            except Exception as e:
+                print(f"⚠️ Packed prompt failed: {e}")
+            if items is None:
+                print(f"↩️ Packed answer unusable, classifying {len(group)} documents one by one")
+        if items is None:
+            unpacked.extend(group)
+            continue
+        for (pos, snippet, fingerprint), item in zip(group, items):
+            classification = {
+                "document_label": str(item.get("label", "Unknown")).strip(),
+                "explanation": str(item.get("explanation", "")).strip(),
+            }
+            llm_cache.put(make_key(LLM_PACKED_CACHE_NAMESPACE, snippet), classification)
+            fingerprint_index.put(LLM_PACKED_CACHE_NAMESPACE, fingerprint, classification)
+            results[pos] = {"filename": filenames[pos], **classification, "status": "OK", "token_retries": 0, "packed": True}
+            DOCUMENT_CLASSIFICATIONS.inc(source="llm_packed")
+
+    for pos, _, _ in unpacked:
+        results[pos] = process_text(texts[pos], filenames[pos])
+    return results
+
+
+def normalize_label(label: str) -> str:
+    """Collapse whitespace and case so equal labels share one embedding."""
+    return " ".join(str(label).split()).lower()
+
+
+def embed_labels(labels: list) -> list:
+    """
+    Return one embedding per label.
+    Cached labels are served from the embedding cache; all unseen labels
+    are sent to watsonx in a single batched call.
+    """
+    normalized = [normalize_label(label) for label in labels]
+    vectors = {}
+    missing = []
+    for text in dict.fromkeys(normalized):
+        cached = embedding_cache.get(make_key(wx_embedding_model, text))
+        if cached is not None:
+            vectors[text] = cached
+        else:
+            missing.append(text)
+
+    if missing:
+        with EMBEDDING_CALL_SECONDS.time():
+            emb_results = wx_embeddings.embed_documents(texts=missing)
+        for text, e in zip(missing, emb_results):
+            vector = e if isinstance(e, list) else e.get("embedding", [])
+            embedding_cache.put(make_key(wx_embedding_model, text), vector)
+            vectors[text] = vector
+
+    return [vectors[text] for text in normalized]
+
+
+def infer_cluster_label(cluster_df,  sample_size: int = None,similarity_threshold: float = None, text_loader=None):
     """
     Infer a common label for a cluster of documents using majority voting + semantic similarity.
     Works for any sample size (3, 5, etc.)
+    cluster_df may come without the firstpagetxt column; text_loader(sample_rows)
+    then returns the sampled rows with their text, so only those are read.
+    In sequential sampling mode documents are classified in waves: voting stops
+    once the majority is settled and ambiguous clusters escalate to
+    CLUSTER_MAX_SAMPLE_SIZE documents. With DEDUP_ENABLED near-duplicate
+    documents are sampled last.
     """
      # --- Step 0: Load defaults from environment if not passed ---
     sample_size = sample_size or int(os.getenv("CLUSTER_SAMPLE_SIZE", 3))
@@ -78,19 +271,94 @@ def infer_cluster_label(cluster_df,  sample_size: int = None,similarity_threshol
     print(f" Using sample_size={sample_size}, similarity_threshold={similarity_threshold}")
 
     # --- Step 1: sample documents ---
-    sample_rows = cluster_df.sample(n=min(sample_size,len(cluster_df)), random_state=42)
+    if CLUSTER_SAMPLING_MODE == "sequential":
+        max_size = max(CLUSTER_MAX_SAMPLE_SIZE or 2 * sample_size, sample_size)
+    else:
+        max_size = sample_size
+    # A seeded sample of n rows starts with the same rows as a smaller one, so
+    # a larger dedup candidate pool keeps the sampling order
+    pool_size = max(max_size, DEDUP_CANDIDATE_POOL) if DEDUP_ENABLED and len(cluster_df) > 1 else max_size
+    candidates = cluster_df.sample(n=min(pool_size, len(cluster_df)), random_state=42)
+    sample_limit = min(max_size, len(candidates))
+    target = min(sample_size, sample_limit)
+    cursor = 0
+    fingerprints = []
+    distinct, duplicates = [], []  # loaded single-row frames not classified yet
+
+    def next_rows(count):
+        """
+        The next count sample rows with their text. Candidates are loaded and
+        fingerprinted one wave at a time; with DEDUP_ENABLED near-duplicates of
+        earlier documents are only used once the distinct candidates run out.
+        """
+        nonlocal cursor
+        while len(distinct) < count and cursor < len(candidates):
+            batch = candidates.iloc[cursor:cursor + count]
+            cursor += len(batch)
+            if "firstpagetxt" not in batch.columns and text_loader is not None:
+                batch = text_loader(batch)
+            if not DEDUP_ENABLED or "firstpagetxt" not in batch.columns:
+                distinct.extend(batch.iloc[[pos]] for pos in range(len(batch)))
+                continue
+            texts = batch["firstpagetxt"].fillna("").astype(str).str[:MAX_CHARS]
+            for pos, text in enumerate(texts):
+                fp = simhash(text)
+                if any(is_near_duplicate(fp, other) for other in fingerprints):
+                    duplicates.append(batch.iloc[[pos]])
+                else:
+                    fingerprints.append(fp)
+                    distinct.append(batch.iloc[[pos]])
+        rows = distinct[:count]
+        del distinct[:count]
+        while len(rows) < count and duplicates:
+            rows.append(duplicates.pop(0))
+        return pd.concat(rows) if rows else candidates.iloc[:0]
+
     label_records = []  # store {filename, label}
     labels_only = []
 
-    for _, row in sample_rows.iterrows():
+    def classify_row(row):
         print(f"Processing cluster {row['cluster_id']} | file: {row['filename']}")
-        result = process_text(row["firstpagetxt"], row["filename"])
-        label = result.get("document_label", "").strip()
-        explanation = result.get("explanation", "").strip()
-        label_records.append({"filename": row["filename"], "label": label,"explanation": explanation})
-        labels_only.append(label)
-        # if label:
-        #     labels.append(label)
+        return process_text(row["firstpagetxt"], row["filename"])
+
+    def classify_wave(wave_rows):
+        rows = [row for _, row in wave_rows.iterrows()]
+        if LLM_PACKED_PROMPTS and len(rows) > 1:
+            print(f"Processing cluster {rows[0]['cluster_id']} | {len(rows)} files in one packed prompt")
+            results = process_texts_packed([row["firstpagetxt"] for row in rows], [row["filename"] for row in rows])
+        else:
+            # Classify concurrently; map() keeps the sample order
+            workers = max(1, min(LLM_MAX_CONCURRENCY, len(rows)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(classify_row, rows))
+        for row, result in zip(rows, results):
+            label = result.get("document_label", "").strip()
+            explanation = result.get("explanation", "").strip()
+            label_records.append({"filename": row["filename"], "label": label,"explanation": explanation})
+            labels_only.append(label)
+
+    if CLUSTER_SAMPLING_MODE != "sequential":
+        classify_wave(next_rows(target))
+
+    # Sequential: each wave is the fewest documents that could still settle the vote
+    while CLUSTER_SAMPLING_MODE == "sequential":
+        top_count = max(labels_only.count(l) for l in set(labels_only)) if labels_only else 0
+        needed = int(np.ceil(MAJORITY_THRESHOLD * target - 1e-9))
+        remaining = target - len(labels_only)
+        if top_count >= needed:
+            break  # majority reached, the remaining votes cannot change it
+        if top_count + remaining < needed:
+            if target < sample_limit:
+                # Ambiguous: no majority possible at this size, escalate
+                target = sample_limit
+                print(f"🔁 Cluster ambiguous after {len(labels_only)} labels, escalating sample to {target}")
+                continue
+            # No majority possible at all: the similarity step still gets the full sample
+            classify_wave(next_rows(target - len(labels_only)))
+            break
+        wave = min(remaining, needed - top_count)
+        classify_wave(next_rows(wave))
+
     if not labels_only:
         return {
             "cluster_label": "Unknown",
@@ -106,7 +374,7 @@ def infer_cluster_label(cluster_df,  sample_size: int = None,similarity_threshol
     majority_ratio = counts.max() / len(labels_only)
 
     # If majority (e.g. 2/3 or 3/5), mark as Auto
-    if majority_ratio >= 0.6:  # two-thirds threshold
+    if majority_ratio >= MAJORITY_THRESHOLD:  # two-thirds threshold
         return {
             "cluster_label": top_label,
             "labels": label_records,
@@ -116,8 +384,9 @@ def infer_cluster_label(cluster_df,  sample_size: int = None,similarity_threshol
 
     # --- Step 3: Semantic similarity (Watsonx embeddings) ---
     try:
-        emb_results = wx_embeddings.embed_documents(texts=labels_only)
-        embeddings = [e if isinstance(e, list) else e.get("embedding", []) for e in emb_results]
+        # sklearn is slow to import; load it on first use, not at service start
+        from sklearn.metrics.pairwise import cosine_similarity
+        embeddings = embed_labels(labels_only)
 
         sim_matrix = cosine_similarity(embeddings)
         upper_triangle = sim_matrix[np.triu_indices_from(sim_matrix, k=1)]
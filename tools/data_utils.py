@@ -3,15 +3,36 @@ db_utils.py
 ------------
 Unified data I/O utilities for labeling pipeline.
 Supports:
- - CSV read/write (local workflow)
- - MySQL read/write (persistent storage)
+ - CSV read/write (local workflow) with an append-only label journal
+ - optional Parquet/Feather sidecar for column projection and lazy text reads
+ - MySQL read/write (persistent storage) over a shared connection pool
+ - two-phase MySQL cluster reads: metadata first, text for sampled asset_ids only
+ - process-level dataset cache shared by all endpoints
 """
 
 import os
+import json
+import shutil
+import time
+import bisect
+import weakref
+import threading
+from contextlib import contextmanager
 import pandas as pd
 import mysql.connector
+from mysql.connector import pooling
 from dotenv import load_dotenv
 from fastapi import HTTPException
+from tools.cluster_index import find_cluster_index
+from tools.metrics import DB_QUERY_SECONDS, LABEL_WRITE_SECONDS
+
+# Optional: columnar sidecar storage
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+except ImportError:
+    pa = pq = feather = None
 
 # ---------- LOAD ENV ----------
 load_dotenv()
@@ -20,6 +41,21 @@ load_dotenv()
 TABLE_NAME = os.getenv("TABLE_NAME", "core_assets")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "./data")
 CSV_PATH = os.path.join(OUTPUT_DIR, f"{TABLE_NAME}_sample.csv")
+# One JSON line per labeled cluster, overlaid on the CSV until compacted
+LABEL_JOURNAL_PATH = os.path.join(OUTPUT_DIR, f"{TABLE_NAME}_label_journal.jsonl")
+LABEL_JOURNAL_COMPACT_EVERY = int(os.getenv("LABEL_JOURNAL_COMPACT_EVERY", "500"))
+LABEL_COLUMNS = ["cluster_label", "label_status", "labels_used"]
+TEXT_COLUMN = "firstpagetxt"
+
+# Columnar sidecar of the CSV: parquet | feather | off (needs pyarrow)
+COLUMNAR_FORMAT = os.getenv("COLUMNAR_FORMAT", "parquet").lower()
+COLUMNAR_PATH = os.path.splitext(CSV_PATH)[0] + (".feather" if COLUMNAR_FORMAT == "feather" else ".parquet")
+COLUMNAR_ROW_GROUP_SIZE = int(os.getenv("COLUMNAR_ROW_GROUP_SIZE", "5000"))
+
+# Reuse loaded datasets across requests (CSV: file mtime/size, DB: label version)
+DATASET_CACHE_ENABLED = os.getenv("DATASET_CACHE_ENABLED", "true").lower() == "true"
+# Optional max age in seconds, e.g. when other processes also write the DB (0 = off)
+DATASET_CACHE_TTL = float(os.getenv("DATASET_CACHE_TTL", "0"))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 MYSQL_CONFIG = {
@@ -29,29 +65,208 @@ MYSQL_CONFIG = {
     "port": int(os.getenv("MYSQL_PORT", "3306")),
     "database": os.getenv("MYSQL_DATABASE", "opendata_rijksoverheid_dbs"),
 }
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+MYSQL_POOL_NAME = os.getenv("MYSQL_POOL_NAME", "labeling_pool")
+# Max seconds a request waits for a free pooled connection (0 = no limit)
+MYSQL_POOL_WAIT_SECONDS = float(os.getenv("MYSQL_POOL_WAIT_SECONDS", "30"))
+# Readiness checks give up sooner, so a busy pool reports "not ready" instead of hanging
+DB_PING_WAIT_SECONDS = float(os.getenv("DB_PING_WAIT_SECONDS", "2"))
+
+# Bulk label write-back for multi-cluster runs
+LABEL_FLUSH_SIZE = int(os.getenv("LABEL_FLUSH_SIZE", "50"))
+LABEL_FLUSH_INTERVAL = float(os.getenv("LABEL_FLUSH_INTERVAL", "10"))
+
+# Rows per chunk for streaming reads (exports, server-side cursors)
+READ_CHUNK_SIZE = int(os.getenv("READ_CHUNK_SIZE", "5000"))
+# Cluster reads skip firstpagetxt; the text of sampled documents is fetched by asset_id
+DB_TWO_PHASE_READ = os.getenv("DB_TWO_PHASE_READ", "true").lower() == "true"
+ASSET_ID_COLUMN = "asset_id"
+# asset_ids per text query
+DB_TEXT_BATCH_SIZE = int(os.getenv("DB_TEXT_BATCH_SIZE", "500"))
+
+## -----------------------------------------------------------------
+# CONNECTION POOL
+## -----------------------------------------------------------------
+_pool = None
+_pool_lock = threading.Lock()
+# mysql.connector raises PoolError when exhausted; the semaphore makes callers wait instead
+_pool_slots = threading.BoundedSemaphore(MYSQL_POOL_SIZE)
+
+# Errors that mean the connection itself is gone (server restart, idle timeout, network)
+CONNECTION_LOST_ERRNOS = {2006, 2013, 2055}
+
+
+def get_pool() -> pooling.MySQLConnectionPool:
+    """Create the shared connection pool on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name=MYSQL_POOL_NAME,
+                    pool_size=MYSQL_POOL_SIZE,
+                    **MYSQL_CONFIG
+                )
+                print(f"🔌 MySQL pool '{MYSQL_POOL_NAME}' created (size={MYSQL_POOL_SIZE})")
+    return _pool
+
+
+@contextmanager
+def db_connection(wait: float = None):
+    """
+    Borrow a healthy connection from the pool and return it afterwards.
+    get_connection() checks is_connected() and reconnects stale connections.
+    Waits at most wait seconds (default MYSQL_POOL_WAIT_SECONDS) for a free
+    connection and raises a 503 after that.
+    """
+    wait = MYSQL_POOL_WAIT_SECONDS if wait is None else wait
+    if not (_pool_slots.acquire(timeout=wait) if wait > 0 else _pool_slots.acquire()):
+        raise HTTPException(
+            status_code=503,
+            detail=f"No MySQL connection free within {wait:g}s (pool size {MYSQL_POOL_SIZE})"
+        )
+    conn = None
+    try:
+        try:
+            conn = get_pool().get_connection()
+        except mysql.connector.Error as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"MySQL connection failed: {str(e)}"
+            )
+        yield conn
+    finally:
+        if conn is not None:
+            try:
+                conn.close()  # returns the connection to the pool
+            except Exception:
+                pass
+        _pool_slots.release()
+
+
+def _run_with_reconnect(work, operation: str = "read"):
+    """
+    Run work(conn) on a pooled connection.
+    Retries once on a fresh connection when the connection was lost mid-query.
+    Every attempt is timed in db_query_duration_seconds.
+    """
+    for attempt in range(2):
+        with db_connection() as conn:
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = work(conn)
+                outcome = "ok"
+                return result
+            except (mysql.connector.OperationalError, mysql.connector.InterfaceError) as e:
+                if attempt == 0 and getattr(e, "errno", None) in CONNECTION_LOST_ERRNOS:
+                    print(f"⚠️ MySQL connection lost ({e}), retrying once")
+                    outcome = "reconnect"
+                    continue
+                raise
+            finally:
+                DB_QUERY_SECONDS.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+
+def db_ping() -> bool:
+    """True if a pooled connection answers; for readiness checks."""
+    try:
+        with db_connection(wait=DB_PING_WAIT_SECONDS) as conn:
+            conn.ping(reconnect=True, attempts=1)
+        return True
+    except (HTTPException, mysql.connector.Error) as e:
+        print(f"⚠️ MySQL ping failed: {e}")
+        return False
+
+
 ## -----------------------------------------------------------------
 # GENERIC DB EXECUTE
 ## -----------------------------------------------------------------
 def db_execute(query: str, params: tuple = None) -> pd.DataFrame:
     """Run a MySQL query and return results as a DataFrame."""
 
-    # Connect
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
+    def work(conn):
         cur = conn.cursor()
+        try:
+            print(query)
+            cur.execute(query, params or ())
+            rows = cur.fetchall()
+            columns = [desc[0].lower() for desc in cur.description]
+            return pd.DataFrame(rows, columns=columns)
+        finally:
+            cur.close()
+
+    try:
+        return _run_with_reconnect(work)
+
+    except HTTPException:
+        raise
+
     except mysql.connector.Error as e:
         raise HTTPException(
             status_code=500,
-            detail=f"MySQL connection failed: {str(e)}"
+            detail=f"MySQL query failed: {str(e)}"
         )
 
-    # Execute
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Unexpected MySQL error: {str(e)}"
+        )
+
+def _fetch_chunks(cur, chunk_size: int):
+    """DataFrames of at most chunk_size rows; one empty frame (with columns) for an empty result."""
+    columns = [desc[0].lower() for desc in cur.description]
+    empty = True
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        empty = False
+        yield pd.DataFrame(rows, columns=columns)
+    if empty:
+        yield pd.DataFrame(columns=columns)
+
+def db_read_frame(query: str, params: tuple = None, chunk_size: int = READ_CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Like db_execute, for large results: rows are fetched from an unbuffered
+    cursor chunk by chunk and appended to one list per column. Each value is
+    held once, referenced from its column list and then from the frame; no
+    buffered result set, fetchall list of row tuples or concatenated copy of
+    chunk frames is kept next to it. Memory still grows with the result, so
+    callers that do not need the whole frame use db_execute_chunks.
+    """
+
+    def work(conn):
+        cur = conn.cursor(buffered=False)
+        try:
+            print(query)
+            cur.execute(query, params or ())
+            names = [desc[0].lower() for desc in cur.description]
+            values = [[] for _ in names]
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for column, column_values in zip(zip(*rows), values):
+                    column_values.extend(column)
+                del rows
+            # Positional keys: a query may return the same column name twice
+            frame = pd.DataFrame(dict(enumerate(values)), columns=range(len(names)))
+            frame.columns = names
+            values.clear()
+            return frame
+        finally:
+            try:
+                cur.close()
+            except mysql.connector.Error:
+                conn.consume_results()
+                cur.close()
+
     try:
-        print(query)
-        cur.execute(query, params or ())
-        rows = cur.fetchall()
-        columns = [desc[0].lower() for desc in cur.description]
-        return pd.DataFrame(rows, columns=columns)
+        return _run_with_reconnect(work)
+
+    except HTTPException:
+        raise
 
     except mysql.connector.Error as e:
         raise HTTPException(
@@ -65,31 +280,60 @@ def db_execute(query: str, params: tuple = None) -> pd.DataFrame:
             detail=f"Unexpected MySQL error: {str(e)}"
         )
 
-    finally:
+def db_execute_chunks(query: str, params: tuple = None, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Run a MySQL query on an unbuffered (server-side) cursor and yield
+    DataFrames of at most chunk_size rows, so the result set is never held
+    in memory at once. The pooled connection is held until the generator
+    is exhausted or closed.
+    """
+    with db_connection() as conn:
+        cur = None
+        start = time.perf_counter()
         try:
-            cur.close()
-            conn.close()
-        except:
-            pass
+            print(query)
+            cur = conn.cursor(buffered=False)
+            cur.execute(query, params or ())
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, operation="stream", outcome="ok")
+            yield from _fetch_chunks(cur, chunk_size)
+        except mysql.connector.Error as e:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, operation="stream", outcome="error")
+            raise HTTPException(
+                status_code=500,
+                detail=f"MySQL query failed: {str(e)}"
+            )
+        finally:
+            if cur is not None:
+                try:
+                    cur.close()
+                except mysql.connector.Error:
+                    # Stopped early: drain the unread rows before the connection goes back to the pool
+                    conn.consume_results()
+                    cur.close()
 
 def db_execute_write(query: str, params: tuple = None) -> int:
     """
     Execute INSERT/UPDATE/DELETE queries.
     Returns number of affected rows.
     """
-    try:
-        conn = mysql.connector.connect(**MYSQL_CONFIG)
+
+    def work(conn):
         cur = conn.cursor()
-    except mysql.connector.Error as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"MySQL connection failed: {str(e)}"
-        )
+        try:
+            cur.execute(query, params or ())
+            conn.commit()
+            return cur.rowcount
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
 
     try:
-        cur.execute(query, params or ())
-        conn.commit()
-        return cur.rowcount
+        return _run_with_reconnect(work, "write")
+
+    except HTTPException:
+        raise
 
     except mysql.connector.Error as e:
         raise HTTPException(
@@ -103,35 +347,329 @@ def db_execute_write(query: str, params: tuple = None) -> int:
             detail=f"Unexpected MySQL error: {str(e)}"
         )
 
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
-
 # -----------------------------------------------------------------
 # CSV FUNCTIONS
 # -----------------------------------------------------------------
-def read_from_csv() -> pd.DataFrame:
-    """Read dataset from CSV file."""
+def read_from_csv(columns: list = None) -> pd.DataFrame:
+    """
+    Read dataset from CSV file.
+    With columnar storage enabled the data is read from the sidecar,
+    which is (re)generated when it is older than the CSV.
+    columns: optional projection; None reads every column.
+    """
     if not os.path.exists(CSV_PATH):
         raise FileNotFoundError(f"❌ CSV not found: {CSV_PATH}")
 
-    df = pd.read_csv(CSV_PATH)
-    print(f"📄 Loaded {len(df)} rows from CSV.")
+    if columnar_enabled():
+        ensure_columnar_sidecar()
+        if COLUMNAR_FORMAT == "parquet":
+            df = pd.read_parquet(COLUMNAR_PATH, columns=columns)
+        else:
+            df = pd.read_feather(COLUMNAR_PATH, columns=columns)
+        print(f"📄 Loaded {len(df)} rows from {COLUMNAR_FORMAT} sidecar.")
+    else:
+        df = pd.read_csv(CSV_PATH, usecols=columns)
+        print(f"📄 Loaded {len(df)} rows from CSV.")
 
-    if "firstpagetxt" in df.columns:
-        df["firstpagetxt"] = df["firstpagetxt"].fillna("").astype(str)
+    if TEXT_COLUMN in df.columns:
+        df[TEXT_COLUMN] = df[TEXT_COLUMN].fillna("").astype(str)
     return df
 
 
+def reset_csv_labels() -> int:
+    """Clear the label columns in the CSV (and journal). Returns row count."""
+    with _dataset_lock, _journal_lock:
+        cache_was_valid = _valid_cache_keys("csv")
+        df = read_from_csv()
+        for col in LABEL_COLUMNS:
+            df[col] = None
+        clear_label_journal()
+        with LABEL_WRITE_SECONDS.time(target="csv_reset"):
+            tmp_path = CSV_PATH + ".tmp"
+            df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, CSV_PATH)
+            write_columnar_sidecar(df)
+        update_cached_labels("csv", None, cache_was_valid)
+        print(f"Reset CSV file: {CSV_PATH}")
+        return len(df)
+
+
+# -----------------------------------------------------------------
+# COLUMNAR SIDECAR (Parquet / Feather)
+# -----------------------------------------------------------------
+_sidecar_lock = threading.RLock()
+
+
+def columnar_enabled() -> bool:
+    return COLUMNAR_FORMAT in ("parquet", "feather") and pa is not None
+
+
+def csv_columns() -> list:
+    """All columns stored in the CSV (or its sidecar)."""
+    if columnar_enabled():
+        ensure_columnar_sidecar()
+        return pq.read_schema(COLUMNAR_PATH).names if COLUMNAR_FORMAT == "parquet" \
+            else feather.read_table(COLUMNAR_PATH, memory_map=True).schema.names
+    return pd.read_csv(CSV_PATH, nrows=0).columns.tolist()
+
+
+def csv_metadata_columns() -> list:
+    """All dataset columns except the document text."""
+    return [c for c in csv_columns() if c != TEXT_COLUMN]
+
+
+def iter_csv_chunks(columns: list = None, chunk_size: int = READ_CHUNK_SIZE):
+    """
+    Yield the CSV dataset as DataFrames of at most chunk_size rows with
+    journaled labels applied. columns: optional projection (label columns
+    are always available, as in get_data()).
+    Parquet is read batch by batch, Feather memory mapped, the CSV in chunks.
+    """
+    if not os.path.exists(CSV_PATH):
+        raise FileNotFoundError(f"❌ CSV not found: {CSV_PATH}")
+    stored = csv_columns()
+    wanted = stored + [c for c in LABEL_COLUMNS if c not in stored] if columns is None else columns
+    # Labels are overlaid by cluster_id, so read it whenever a label column is wanted
+    overlay = any(c in LABEL_COLUMNS for c in wanted)
+    read_columns = [c for c in stored if c in wanted or (overlay and (c == "cluster_id" or c in LABEL_COLUMNS))]
+    records = read_label_journal() if overlay else {}
+
+    if columnar_enabled():
+        if COLUMNAR_FORMAT == "parquet":
+            batches = (b.to_pandas() for b in pq.ParquetFile(COLUMNAR_PATH).iter_batches(
+                batch_size=chunk_size, columns=read_columns))
+        else:
+            table = feather.read_table(COLUMNAR_PATH, columns=read_columns, memory_map=True)
+            batches = (table.slice(o, chunk_size).to_pandas() for o in range(0, table.num_rows, chunk_size))
+    else:
+        batches = pd.read_csv(CSV_PATH, usecols=read_columns, chunksize=chunk_size)
+
+    for chunk in batches:
+        if overlay:
+            for col in LABEL_COLUMNS:
+                if col not in chunk.columns:
+                    chunk[col] = None
+            overlay_labels(chunk, records)
+        yield chunk[wanted]
+
+
+def write_columnar_sidecar(df: pd.DataFrame):
+    """Write the columnar copy of a full CSV frame (no-op when disabled)."""
+    if not columnar_enabled():
+        return
+    with _sidecar_lock:
+        tmp_path = COLUMNAR_PATH + ".tmp"
+        table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+        if COLUMNAR_FORMAT == "parquet":
+            pq.write_table(table, tmp_path, row_group_size=COLUMNAR_ROW_GROUP_SIZE)
+        else:
+            feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, COLUMNAR_PATH)
+        print(f"🧱 Columnar sidecar written: {COLUMNAR_PATH}")
+
+
+def ensure_columnar_sidecar():
+    """Regenerate the sidecar from the CSV when missing or older than it."""
+    with _sidecar_lock:
+        csv_stat = os.stat(CSV_PATH)
+        if os.path.exists(COLUMNAR_PATH) and os.stat(COLUMNAR_PATH).st_mtime_ns >= csv_stat.st_mtime_ns:
+            return
+        print(f"🧱 Building {COLUMNAR_FORMAT} sidecar from {CSV_PATH}")
+        df = pd.read_csv(CSV_PATH)
+        if TEXT_COLUMN in df.columns:
+            df[TEXT_COLUMN] = df[TEXT_COLUMN].fillna("").astype(str)
+        write_columnar_sidecar(df)
+
+
+def read_csv_text(positions: list) -> list:
+    """
+    Fetch the document text for the given row positions only.
+    Parquet reads just the row groups holding those rows, Feather is
+    memory mapped; without a sidecar the text column is read from the CSV.
+    """
+    positions = [int(p) for p in positions]
+    if not positions:
+        return []
+    if not columnar_enabled():
+        text = pd.read_csv(CSV_PATH, usecols=[TEXT_COLUMN])[TEXT_COLUMN]
+        return text.iloc[positions].fillna("").astype(str).tolist()
+
+    ensure_columnar_sidecar()
+    if COLUMNAR_FORMAT == "feather":
+        column = feather.read_table(COLUMNAR_PATH, columns=[TEXT_COLUMN], memory_map=True).column(0)
+        values = column.take(pa.array(positions)).to_pylist()
+    else:
+        parquet = pq.ParquetFile(COLUMNAR_PATH)
+        # Map each row position to (row group, offset inside the group)
+        starts, total = [], 0
+        for i in range(parquet.num_row_groups):
+            starts.append(total)
+            total += parquet.metadata.row_group(i).num_rows
+        groups = sorted({bisect.bisect_right(starts, p) - 1 for p in positions})
+        table = parquet.read_row_groups(groups, columns=[TEXT_COLUMN])
+        group_offset = {}
+        offset = 0
+        for g in groups:
+            group_offset[g] = offset
+            offset += parquet.metadata.row_group(g).num_rows
+        local = []
+        for p in positions:
+            g = bisect.bisect_right(starts, p) - 1
+            local.append(group_offset[g] + p - starts[g])
+        values = table.column(0).take(pa.array(local)).to_pylist()
+    return ["" if v is None else str(v) for v in values]
+
+
+def attach_csv_text(rows: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of rows (indexed by CSV row position) with their text."""
+    rows = rows.copy()
+    rows[TEXT_COLUMN] = read_csv_text(rows.index.tolist())
+    return rows
+
+
 def save_to_csv(df: pd.DataFrame):
     """Save DataFrame back to CSV (overwrites in place)."""
     df.to_csv(CSV_PATH, index=False)
     print(f"💾 CSV updated: {CSV_PATH}")
 
 
+# -----------------------------------------------------------------
+# CSV LABEL JOURNAL
+# -----------------------------------------------------------------
+# Lock order: _dataset_lock before _journal_lock
+_dataset_lock = threading.RLock()
+_journal_lock = threading.RLock()
+_journal_records = None  # records in the journal file, counted on first use
+
+
+def append_label_journal(cluster_id: int, label: str, status: str, labels_used: str):
+    """Append one labeled cluster to the journal instead of rewriting the CSV."""
+    global _journal_records
+    record = {
+        "cluster_id": int(cluster_id),
+        "cluster_label": label,
+        "label_status": status,
+        "labels_used": labels_used,
+    }
+    with _dataset_lock, _journal_lock:
+        cache_was_valid = _valid_cache_keys("csv")
+        pending = label_journal_size()
+        with LABEL_WRITE_SECONDS.time(target="csv_journal"), open(LABEL_JOURNAL_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _journal_records = pending + 1
+        update_cached_labels("csv", {record["cluster_id"]: record}, cache_was_valid)
+        # Compaction rewrites the whole CSV, so only once the journal is large
+        if LABEL_JOURNAL_COMPACT_EVERY and _journal_records >= LABEL_JOURNAL_COMPACT_EVERY:
+            compact_label_journal()
+
+
+def label_journal_size() -> int:
+    """Number of records waiting in the journal (the file is read once per process)."""
+    global _journal_records
+    with _journal_lock:
+        if _journal_records is None:
+            _journal_records = 0
+            if os.path.exists(LABEL_JOURNAL_PATH):
+                with open(LABEL_JOURNAL_PATH, encoding="utf-8") as f:
+                    _journal_records = sum(1 for line in f if line.strip())
+        return _journal_records
+
+
+def backup_csv_dataset(backup_path: str) -> str:
+    """
+    Copy the CSV and its pending label journal (to <backup>_label_journal.jsonl),
+    without compacting. Together they hold the current labels.
+    """
+    with _journal_lock:
+        shutil.copy(CSV_PATH, backup_path)
+        if os.path.exists(LABEL_JOURNAL_PATH):
+            shutil.copy(LABEL_JOURNAL_PATH, os.path.splitext(backup_path)[0] + "_label_journal.jsonl")
+    return backup_path
+
+
+def read_label_journal() -> dict:
+    """Return {cluster_id: record}; later records win, torn lines are skipped."""
+    records = {}
+    if not os.path.exists(LABEL_JOURNAL_PATH):
+        return records
+    with _journal_lock, open(LABEL_JOURNAL_PATH, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partially written line after a crash
+            records[record["cluster_id"]] = record
+    return records
+
+
+def overlay_labels(df: pd.DataFrame, records: dict) -> pd.DataFrame:
+    """Set label columns in place from {cluster_id: {column: value}}."""
+    if not records or df.empty:
+        return df
+    # Indexed frames update only the rows of the touched clusters
+    index = find_cluster_index(df)
+    if index is not None:
+        for cid, record in records.items():
+            index.set_labels(cid, record)
+        return df
+    mask = df["cluster_id"].isin(list(records.keys()))
+    for col in LABEL_COLUMNS:
+        values = {cid: record.get(col) for cid, record in records.items()}
+        if df[col].dtype != object:
+            df[col] = df[col].astype(object)
+        df.loc[mask, col] = df.loc[mask, "cluster_id"].map(values)
+    return df
+
+
+def apply_label_journal(df: pd.DataFrame, records: dict = None) -> pd.DataFrame:
+    """Overlay journal labels on a DataFrame read from the CSV."""
+    records = read_label_journal() if records is None else records
+    if not records or df.empty:
+        return df
+    overlay_labels(df, records)
+    print(f"📝 Applied {len(records)} journaled cluster labels")
+    return df
+
+
+def clear_label_journal():
+    """Drop all journaled labels (after a reset or a compaction)."""
+    global _journal_records
+    with _journal_lock:
+        if os.path.exists(LABEL_JOURNAL_PATH):
+            os.remove(LABEL_JOURNAL_PATH)
+        _journal_records = 0
+
+
+def compact_label_journal() -> int:
+    """
+    Merge the journal into the CSV and clear it.
+    The merged file is written to a temp file and swapped in atomically,
+    so a crash never leaves a half-written CSV. Returns merged clusters.
+    """
+    with _dataset_lock, _journal_lock:
+        records = read_label_journal()
+        if not records:
+            return 0
+        cache_was_valid = _valid_cache_keys("csv")
+        df = read_from_csv()
+        for col in LABEL_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        apply_label_journal(df, records)
+        with LABEL_WRITE_SECONDS.time(target="csv_compact"):
+            tmp_path = CSV_PATH + ".tmp"
+            df.to_csv(tmp_path, index=False)
+            os.replace(tmp_path, CSV_PATH)
+            write_columnar_sidecar(df)
+        clear_label_journal()
+        # Content is unchanged, only the files moved on
+        _revalidate_dataset_cache("csv", cache_was_valid)
+        print(f"🗜️ Compacted {len(records)} journaled clusters into {CSV_PATH}")
+        return len(records)
+
+
 # -----------------------------------------------------------------
 # MYSQL FUNCTIONS
 # -----------------------------------------------------------------
@@ -141,7 +679,30 @@ def read_from_mysql() -> pd.DataFrame:
         FROM {TABLE_NAME}
         WHERE cluster_id IS NOT NULL
     """
-    return db_execute(query)
+    return db_read_frame(query)
+
+_db_columns = None  # column names of the dataset table, read once
+
+
+def db_table_columns() -> list:
+    """
+    Column names of the dataset table (lowercase, like db_execute results).
+    Read on first use; extend_mysql_schema() resets the cached list.
+    """
+    global _db_columns
+    if _db_columns is None:
+        _db_columns = db_execute(f"SELECT * FROM {TABLE_NAME} LIMIT 0").columns.tolist()
+    return list(_db_columns)
+
+def db_stream_rows(columns: list = None, chunk_size: int = READ_CHUNK_SIZE):
+    """Stream the clustered rows of the table in chunks (columns validated by the caller)."""
+    column_sql = "*" if columns is None else ", ".join(f"`{c}`" for c in columns)
+    query = f"""
+        SELECT {column_sql}
+        FROM {TABLE_NAME}
+        WHERE cluster_id IS NOT NULL
+    """
+    return db_execute_chunks(query, chunk_size=chunk_size)
 
 def db_read_unlabeled_cluster() -> pd.DataFrame:
     query = f"""
@@ -152,19 +713,62 @@ def db_read_unlabeled_cluster() -> pd.DataFrame:
     """
     return db_execute(query)
 
+def db_read_overview() -> dict:
+    """
+    Coverage and status counts of the clustered rows, aggregated by MySQL.
+    Transfers one row per status plus the unlabeled cluster ids, not the
+    document rows; keys match ClusterIndex.summary().
+    """
+    totals = db_execute(f"""
+        SELECT COUNT(*) AS total_documents,
+               COUNT(DISTINCT cluster_id) AS total_clusters,
+               COUNT(DISTINCT CASE WHEN cluster_label IS NOT NULL THEN cluster_id END) AS labeled_clusters
+        FROM {TABLE_NAME}
+        WHERE cluster_id IS NOT NULL
+    """).iloc[0]
+    statuses = db_execute(f"""
+        SELECT COALESCE(label_status, 'Unlabeled') AS status, COUNT(*) AS documents
+        FROM {TABLE_NAME}
+        WHERE cluster_id IS NOT NULL
+        GROUP BY COALESCE(label_status, 'Unlabeled')
+        ORDER BY documents DESC
+    """)
+    unlabeled = db_read_unlabeled_cluster()
+    total_clusters = int(totals["total_clusters"])
+    labeled = int(totals["labeled_clusters"])
+    return {
+        "total_documents": int(totals["total_documents"]),
+        "total_clusters": total_clusters,
+        "labeled_clusters": labeled,
+        "unlabeled_clusters": total_clusters - labeled,
+        "coverage_percent": round(labeled / total_clusters * 100, 2) if total_clusters else 0,
+        "status_documents": {row.status: int(row.documents) for row in statuses.itertuples(index=False)},
+        "unlabeled_cluster_ids": [int(cid) for cid in unlabeled["cluster_id"].tolist()],
+    }
+
+def _db_cluster_columns(alias: str = "") -> str:
+    """Select list of cluster reads: everything but the text in two-phase mode."""
+    prefix = f"{alias}." if alias else ""
+    if not DB_TWO_PHASE_READ:
+        return f"{prefix}*"
+    columns = [c for c in db_table_columns() if c != TEXT_COLUMN]
+    return ", ".join(f"{prefix}`{c}`" for c in columns)
+
 def db_read_single_cluster(cluster_id: int) -> pd.DataFrame:
+    # Ordered by asset_id so the seeded sample does not depend on the query plan
     query = f"""
-        SELECT *
+        SELECT {_db_cluster_columns()}
         FROM {TABLE_NAME}
         WHERE cluster_id = %s
+        ORDER BY {ASSET_ID_COLUMN}
     """
-    return db_execute(query, (cluster_id,))
+    return db_read_frame(query, (cluster_id,))
 
 
 def db_read_limit_cluster(limit: int) -> pd.DataFrame:
 
     query = f"""
-        SELECT t1.*
+        SELECT {_db_cluster_columns("t1")}
         FROM {TABLE_NAME} AS t1
         JOIN (
             SELECT DISTINCT cluster_id
@@ -172,10 +776,33 @@ def db_read_limit_cluster(limit: int) -> pd.DataFrame:
             WHERE cluster_id IS NOT NULL AND cluster_label IS NULL
             LIMIT %s
         ) AS limited_clusters
-        ON t1.cluster_id = limited_clusters.cluster_id;
+        ON t1.cluster_id = limited_clusters.cluster_id
+        ORDER BY t1.{ASSET_ID_COLUMN};
     """
-    print(query)
-    return db_execute(query, (limit,))
+    return db_read_frame(query, (limit,))
+
+def db_read_text(asset_ids: list) -> dict:
+    """firstpagetxt of the given asset_ids, in batches of DB_TEXT_BATCH_SIZE ids."""
+    ids = list(dict.fromkeys(asset_ids))
+    texts = {}
+    for start in range(0, len(ids), DB_TEXT_BATCH_SIZE):
+        batch = ids[start:start + DB_TEXT_BATCH_SIZE]
+        placeholders = ", ".join(["%s"] * len(batch))
+        rows = db_execute(f"""
+            SELECT {ASSET_ID_COLUMN}, {TEXT_COLUMN}
+            FROM {TABLE_NAME}
+            WHERE {ASSET_ID_COLUMN} IN ({placeholders})
+        """, tuple(batch))
+        texts.update(zip(rows[ASSET_ID_COLUMN].tolist(), rows[TEXT_COLUMN].tolist()))
+    return texts
+
+def attach_db_text(rows: pd.DataFrame) -> pd.DataFrame:
+    """Return a copy of rows (from a two-phase cluster read) with their text."""
+    rows = rows.copy()
+    asset_ids = rows[ASSET_ID_COLUMN].tolist()
+    texts = db_read_text(asset_ids)
+    rows[TEXT_COLUMN] = [texts.get(a) or "" for a in asset_ids]
+    return rows
 
 def update_mysql_cluster_label(cluster_id: int, label: str, status: str, labels_used: str):
     query = f"""
@@ -185,7 +812,114 @@ def update_mysql_cluster_label(cluster_id: int, label: str, status: str, labels_
             labels_used = %s
         WHERE cluster_id = %s
     """
-    return db_execute_write(query, (label, status, labels_used, cluster_id))
+    with LABEL_WRITE_SECONDS.time(target="db"):
+        affected = db_execute_write(query, (label, status, labels_used, cluster_id))
+    update_cached_labels("db", {cluster_id: {
+        "cluster_label": label, "label_status": status, "labels_used": labels_used
+    }})
+    return affected
+
+def update_mysql_cluster_labels_bulk(rows: list) -> int:
+    """
+    Write many cluster labels in one statement and one transaction.
+    rows: list of (cluster_id, label, status, labels_used)
+    """
+    if not rows:
+        return 0
+    case = " ".join(["WHEN %s THEN %s"] * len(rows))
+    placeholders = ", ".join(["%s"] * len(rows))
+    query = f"""
+        UPDATE {TABLE_NAME}
+        SET cluster_label = CASE cluster_id {case} END,
+            label_status = CASE cluster_id {case} END,
+            labels_used = CASE cluster_id {case} END
+        WHERE cluster_id IN ({placeholders})
+    """
+    params = []
+    for field in (1, 2, 3):
+        for row in rows:
+            params.extend((row[0], row[field]))
+    params.extend(row[0] for row in rows)
+    with LABEL_WRITE_SECONDS.time(target="db_bulk"):
+        affected = db_execute_write(query, tuple(params))
+    update_cached_labels("db", {
+        row[0]: {"cluster_label": row[1], "label_status": row[2], "labels_used": row[3]}
+        for row in rows
+    })
+    return affected
+
+
+class LabelWriteBuffer:
+    """
+    Buffers cluster label writes for multi-cluster runs.
+    Flushes as one bulk UPDATE when flush_size labels are pending or
+    flush_interval seconds passed since the last flush, and always on close().
+    Failed batches are retried row by row so the report names the clusters
+    that could not be written.
+    on_flushed(cluster_ids) is called after every flush, written or failed.
+    """
+
+    def __init__(self, flush_size: int = None, flush_interval: float = None, on_flushed=None):
+        self.flush_size = flush_size or LABEL_FLUSH_SIZE
+        self.on_flushed = on_flushed
+        self.flush_interval = flush_interval if flush_interval is not None else LABEL_FLUSH_INTERVAL
+        self._pending = []
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self.written = 0
+        self.batches = 0
+        self.failed = []
+
+    def add(self, cluster_id: int, label: str, status: str, labels_used: str):
+        with self._lock:
+            self._pending.append((cluster_id, label, status, labels_used))
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if len(self._pending) >= self.flush_size or due:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        rows, self._pending = self._pending, []
+        self._last_flush = time.monotonic()
+        if not rows:
+            return
+        self.batches += 1
+        try:
+            update_mysql_cluster_labels_bulk(rows)
+            self.written += len(rows)
+            print(f"💾 Flushed {len(rows)} cluster labels to MySQL")
+        except HTTPException as e:
+            print(f"⚠️ Bulk label write failed ({e.detail}), retrying per cluster")
+            for row in rows:
+                try:
+                    update_mysql_cluster_label(*row)
+                    self.written += 1
+                except HTTPException as row_error:
+                    self.failed.append({"cluster_id": row[0], "error": row_error.detail})
+        finally:
+            if self.on_flushed is not None:
+                self.on_flushed([row[0] for row in rows])
+
+    def close(self):
+        self.flush()
+
+    def report(self) -> dict:
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "failed": self.failed,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
 def update_mysql_reset_labels():
     query = f"""
         UPDATE {TABLE_NAME}
@@ -193,7 +927,9 @@ def update_mysql_reset_labels():
             label_status = NULL,
             labels_used = NULL
     """
-    return db_execute_write(query)
+    affected = db_execute_write(query)
+    update_cached_labels("db", None)
+    return affected
 
 def extend_mysql_schema():
     query = f"""
@@ -203,19 +939,146 @@ def extend_mysql_schema():
         ADD COLUMN IF NOT EXISTS labels_used TEXT;
     """
 
+    global _db_columns
     db_execute_write(query)
+    _db_columns = None
 
     return {"message": f"✅ Table '{TABLE_NAME}' updated with label columns (safe add)."}
 
 
-def get_data(source: str = "csv") -> pd.DataFrame:
+# -----------------------------------------------------------------
+# DATASET CACHE
+# -----------------------------------------------------------------
+_dataset_cache = {}  # (source, include_text) -> {"df", "signature", "loaded_at"}
+_db_label_version = 0
+_db_export_state = None  # (label version, weakref to the frame) of the last DB snapshot CSV
+
+
+def _file_stat(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _dataset_signature(source: str):
+    """What the cached frame of a source was loaded from."""
+    if source == "csv":
+        return (_file_stat(CSV_PATH), _file_stat(LABEL_JOURNAL_PATH))
+    return _db_label_version
+
+
+def _valid_cache_keys(source: str) -> set:
+    """Cache keys of a source whose frames are still current."""
+    with _dataset_lock:
+        signature = _dataset_signature(source)
+        valid = set()
+        for key, entry in _dataset_cache.items():
+            if key[0] != source or entry["signature"] != signature:
+                continue
+            if DATASET_CACHE_TTL and time.monotonic() - entry["loaded_at"] > DATASET_CACHE_TTL:
+                continue
+            valid.add(key)
+        return valid
+
+
+def is_dataset_cached(source: str, include_text: bool = True) -> bool:
+    return (source, include_text) in _valid_cache_keys(source)
+
+
+def _revalidate_dataset_cache(source: str, keys: set):
+    """Mark cached frames current after a write they already reflect."""
+    with _dataset_lock:
+        signature = _dataset_signature(source)
+        for key in keys:
+            if key in _dataset_cache:
+                _dataset_cache[key]["signature"] = signature
+
+
+def invalidate_dataset_cache(source: str = None):
+    """Drop one cached source (or all) so the next get_data reloads it."""
+    global _db_label_version
+    with _dataset_lock:
+        if source in (None, "db"):
+            _db_label_version += 1
+        for key in list(_dataset_cache):
+            if source is None or key[0] == source:
+                del _dataset_cache[key]
+
+
+def update_cached_labels(source: str, records: dict, was_valid: set = None):
+    """
+    Apply our own label writes to the cached frames in place.
+    records: {cluster_id: {column: value}}; None resets all labels.
+    was_valid: cache keys valid before the write (for CSV the write itself
+    changes the file signature).
+    """
+    global _db_label_version
+    with _dataset_lock:
+        valid = _valid_cache_keys(source) if was_valid is None else was_valid
+        if source == "db":
+            _db_label_version += 1
+        for key in [key for key in _dataset_cache if key[0] == source]:
+            if key not in valid:
+                del _dataset_cache[key]
+                continue
+            df = _dataset_cache[key]["df"]
+            if records is None:
+                for col in LABEL_COLUMNS:
+                    df[col] = None
+                index = find_cluster_index(df)
+                if index is not None:
+                    index.reset_labels()
+            else:
+                overlay_labels(df, records)
+        _revalidate_dataset_cache(source, valid)
+
+
+def write_db_export(df: pd.DataFrame, path: str) -> bool:
+    """
+    Write the DB snapshot CSV, unless it was already written from this
+    frame and no DB labels changed since. Returns True if written.
+    """
+    global _db_export_state
+    with _dataset_lock:
+        if (_db_export_state is not None and _db_export_state[0] == _db_label_version
+                and _db_export_state[1]() is df and os.path.exists(path)):
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        df.to_csv(path, index=False)
+        _db_export_state = (_db_label_version, weakref.ref(df))
+        return True
+
+
+def get_data(source: str = "csv", include_text: bool = True) -> pd.DataFrame:
     """
     Unified data reader.
-    - source='csv' → reads from CSV
+    - source='csv' → reads from CSV (columnar sidecar when enabled)
     - source='db' → reads from MySQL
+    include_text=False skips the document text column, for endpoints that
+    only need cluster ids and labels. Without a columnar sidecar the CSV
+    text cannot be read per row, so it is then kept (loaded once) and the
+    lazy text loader is not needed.
+    Loaded frames are cached per source and shared between requests;
+    label writes through this module keep the cached frames current.
     """
+    if source == "csv" and not include_text and not columnar_enabled():
+        include_text = True
+    key = (source, include_text)
+    with _dataset_lock:
+        if DATASET_CACHE_ENABLED and key in _valid_cache_keys(source):
+            return _dataset_cache[key]["df"]
+        signature = _dataset_signature(source)
+        df = _load_data(source, include_text)
+        if DATASET_CACHE_ENABLED:
+            _dataset_cache[key] = {"df": df, "signature": signature, "loaded_at": time.monotonic()}
+        return df
+
+
+def _load_data(source: str, include_text: bool = True) -> pd.DataFrame:
     if source == "csv":
-         df= read_from_csv()
+         df= read_from_csv(None if include_text else csv_metadata_columns())
     elif source == "db":
          df= read_from_mysql()
     else:
@@ -226,6 +1089,11 @@ def get_data(source: str = "csv") -> pd.DataFrame:
         if col not in df.columns:
             df[col] = None
             print(f"Added missing column: {col}")
+        elif df[col].dtype != object:
+            # all-empty columns load as float NaN; labels are strings
+            df[col] = df[col].astype(object).where(df[col].notnull(), None)
+    if source == "csv":
+        df = apply_label_journal(df)
     return df
 
 def update_mysql_reset_labels_limit(limit: int):
@@ -241,4 +1109,7 @@ def update_mysql_reset_labels_limit(limit: int):
             t.label_status = NULL,
             t.labels_used = NULL;
     """
-    return db_execute_write(query, (limit,))
\ No newline at end of file
+    affected = db_execute_write(query, (limit,))
+    # Reset clusters are chosen by MySQL, so drop the cached snapshot
+    invalidate_dataset_cache("db")
+    return affected
\ No newline at end of file
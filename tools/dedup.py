@@ -0,0 +1,262 @@
+"""
+dedup.py
+--------
+Near-duplicate detection for document first pages.
+Supports:
+ - 64-bit SimHash fingerprints over word shingles of firstpagetxt
+ - persistent fingerprint → classification index, so a near-identical
+   document anywhere in the dataset reuses an earlier LLM result
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+import numpy as np
+from dotenv import load_dotenv
+from tools.cache_utils import CACHE_DB_PATH, CACHE_TOUCH_BATCH
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Max differing fingerprint bits for two documents to count as near-duplicates.
+# Lookups use 4 bands of 16 bits, which finds every match up to 3 bits.
+DEDUP_HAMMING_THRESHOLD = int(os.getenv("DEDUP_HAMMING_THRESHOLD", "3"))
+# Number of candidate documents fingerprinted per cluster for diverse sampling
+DEDUP_CANDIDATE_POOL = int(os.getenv("DEDUP_CANDIDATE_POOL", "20"))
+DEDUP_INDEX_MAX_ENTRIES = int(os.getenv("DEDUP_INDEX_MAX_ENTRIES", "200000"))
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+BANDS = 4
+BAND_BITS = FINGERPRINT_BITS // BANDS
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_BIT_SHIFTS = np.arange(FINGERPRINT_BITS, dtype=np.uint64)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word shingles of text (0 for empty text)."""
+    words = _WORD_RE.findall((text or "").lower())
+    if len(words) >= SHINGLE_SIZE:
+        shingles = Counter(" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    else:
+        shingles = Counter(words)
+    if not shingles:
+        return 0
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    weights = np.fromiter(shingles.values(), dtype=np.float64, count=len(shingles))
+    # bits[i, b] = bit b of shingle i, voted +weight / -weight
+    bits = ((hashes[:, None] >> _BIT_SHIFTS) & np.uint64(1)).astype(np.float64)
+    votes = weights @ (bits * 2 - 1)
+    return int(sum(1 << b for b in range(FINGERPRINT_BITS) if votes[b] > 0))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def is_near_duplicate(a: int, b: int, threshold: int = DEDUP_HAMMING_THRESHOLD) -> bool:
+    return hamming(a, b) <= threshold
+
+
+def _signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(fp: int) -> list:
+    mask = (1 << BAND_BITS) - 1
+    return [(fp >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+class FingerprintIndex:
+    """
+    SQLite table of fingerprint → classification per namespace (model +
+    prompt). Candidates share at least one 16-bit band with the query and
+    are then checked on the full Hamming distance.
+    Like SQLiteCache it fails open (SQLite errors count as misses / no-op
+    stores) and hits only queue their last_used update.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int, enabled: bool = True,
+                 threshold: int = DEDUP_HAMMING_THRESHOLD):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._touched = {}  # (namespace, stored fingerprint) -> last_used not yet written
+        self._lock = threading.Lock()
+        self._conn = None
+        self._count = 0
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            band_columns = ", ".join(f"b{i} INTEGER NOT NULL" for i in range(BANDS))
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    namespace TEXT NOT NULL,
+                    fingerprint INTEGER NOT NULL,
+                    {band_columns},
+                    value TEXT NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (namespace, fingerprint)
+                )
+            """)
+            for i in range(BANDS):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{self.table}_b{i} ON {self.table}(namespace, b{i})"
+                )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_used ON {self.table}(last_used)"
+            )
+            self._conn.commit()
+            self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        return self._conn
+
+    def _failed(self, action: str, error: Exception):
+        """Log a SQLite error (caller holds the lock)."""
+        self.errors += 1
+        print(f"⚠️ Fingerprint index '{self.table}' {action} failed: {error}")
+
+    def _rollback(self):
+        try:
+            if self._conn is not None:
+                self._conn.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _flush_touched(self, conn):
+        """Write queued last_used updates (caller holds the lock and commits)."""
+        if self._touched:
+            conn.executemany(
+                f"UPDATE {self.table} SET last_used = ? WHERE namespace = ? AND fingerprint = ?",
+                [(used, namespace, stored) for (namespace, stored), used in self._touched.items()]
+            )
+        self._touched.clear()
+
+    def get(self, namespace: str, fp: int):
+        """Classification of the nearest stored near-duplicate, or None."""
+        if not self.enabled or not fp:
+            return None
+        bands = _bands(fp)
+        where = " OR ".join(f"b{i} = ?" for i in range(BANDS))
+        with self._lock:
+            try:
+                conn = self._connect()
+                rows = conn.execute(
+                    f"SELECT fingerprint, value FROM {self.table} WHERE namespace = ? AND ({where})",
+                    (namespace, *bands)
+                ).fetchall()
+            except sqlite3.Error as e:
+                self._failed("lookup", e)
+                self.misses += 1
+                return None
+            best = None
+            for stored, value in rows:
+                distance = hamming(fp, _unsigned(stored))
+                if distance <= self.threshold and (best is None or distance < best[0]):
+                    best = (distance, stored, value)
+            if best is None:
+                self.misses += 1
+                return None
+            self._touched[(namespace, best[1])] = time.time()
+            if len(self._touched) >= CACHE_TOUCH_BATCH:
+                try:
+                    self._flush_touched(conn)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    # Only recency is lost; the hit still counts
+                    self._failed("last_used update", e)
+                    self._rollback()
+            self.hits += 1
+            return json.loads(best[2])
+
+    def put(self, namespace: str, fp: int, value):
+        """Store a JSON serializable classification for fingerprint fp."""
+        if not self.enabled or not fp:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                exists = conn.execute(
+                    f"SELECT 1 FROM {self.table} WHERE namespace = ? AND fingerprint = ?",
+                    (namespace, _signed(fp))
+                ).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    f"(namespace, fingerprint, {', '.join(f'b{i}' for i in range(BANDS))}, value, last_used) "
+                    f"VALUES (?, ?, {', '.join('?' * BANDS)}, ?, ?)",
+                    (namespace, _signed(fp), *_bands(fp), json.dumps(value, ensure_ascii=False), time.time())
+                )
+                self._touched.pop((namespace, _signed(fp)), None)
+                self._flush_touched(conn)
+                count = self._count + (0 if exists else 1)
+                if count > self.max_entries:
+                    count = self._evict(conn)
+                conn.commit()
+                self._count = count
+            except sqlite3.Error as e:
+                self._failed("store", e)
+                self._rollback()
+
+    def _evict(self, conn) -> int:
+        """Drop the least recently used entries (caller holds the lock); returns the new count."""
+        drop = max(1, self.max_entries // 10)
+        conn.execute(f"""
+            DELETE FROM {self.table} WHERE rowid IN (
+                SELECT rowid FROM {self.table} ORDER BY last_used ASC LIMIT ?
+            )
+        """, (drop,))
+        self.evictions += drop
+        print(f"🧹 Fingerprint index '{self.table}' evicted {drop} entries")
+        return conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.commit()
+            self._count = 0
+            self._touched.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self._count,
+            "max_entries": self.max_entries,
+            "hamming_threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+fingerprint_index = FingerprintIndex(
+    CACHE_DB_PATH, "document_fingerprints", DEDUP_INDEX_MAX_ENTRIES, DEDUP_ENABLED
+)
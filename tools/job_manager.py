@@ -0,0 +1,164 @@
+"""
+job_manager.py
+--------------
+Background jobs for long labeling runs.
+Supports:
+ - submit a run and get a job id back immediately
+ - poll status, progress counters and partial results
+ - cooperative cancellation
+Work runs on a dedicated thread pool, never on the API event loop.
+"""
+
+import os
+import uuid
+import threading
+import traceback
+from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "100"))
+
+FINAL_STATES = ("completed", "failed", "cancelled")
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class LabelingJob:
+    """State of one submitted labeling run."""
+
+    def __init__(self, kind: str, params: dict):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.status = "queued"
+        self.total = 0
+        self.completed = 0
+        self.labeled = 0
+        self.skipped = 0
+        self.errors = 0
+        self.results = []
+        self.summary = None
+        self.error = None
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+
+    def add_result(self, result: dict):
+        """Record one finished cluster (called from worker threads)."""
+        with self._lock:
+            self.results.append(result)
+            self.completed += 1
+            if result.get("error"):
+                self.errors += 1
+            elif result.get("skip"):
+                self.skipped += 1
+            else:
+                self.labeled += 1
+
+    def to_dict(self, include_results: bool = True, offset: int = 0) -> dict:
+        with self._lock:
+            data = {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "params": self.params,
+                "status": self.status,
+                "progress": {
+                    "total": self.total,
+                    "completed": self.completed,
+                    "labeled": self.labeled,
+                    "skipped": self.skipped,
+                    "errors": self.errors,
+                    "percent": round(self.completed / self.total * 100, 2) if self.total else 0.0,
+                },
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "summary": self.summary,
+                "error": self.error,
+            }
+            if include_results:
+                data["results"] = self.results[offset:]
+            return data
+
+
+class JobManager:
+    """Runs labeling jobs on a small thread pool and keeps recent jobs."""
+
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="labeling-job")
+        self._jobs = OrderedDict()
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, params: dict, work) -> LabelingJob:
+        """
+        Queue work(job) and return the job right away.
+        work reports progress through job.set_total / job.add_result,
+        should stop when job.cancel_event is set, and may return a summary dict.
+        """
+        job = LabelingJob(kind, params)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._trim()
+        self._executor.submit(self._run, job, work)
+        print(f"🧵 Job {job.job_id} queued ({kind}, {params})")
+        return job
+
+    def _run(self, job: LabelingJob, work):
+        if job.cancel_event.is_set():
+            job.status = "cancelled"
+            job.finished_at = _now()
+            return
+        job.status = "running"
+        job.started_at = _now()
+        try:
+            job.summary = work(job)
+            job.status = "cancelled" if job.cancel_event.is_set() else "completed"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = _now()
+            print(f"🧵 Job {job.job_id} {job.status}")
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> list:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str):
+        """Request cancellation; running clusters finish, queued ones are skipped."""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINAL_STATES:
+            job.cancel_event.set()
+        return job
+
+    def _trim(self):
+        """Forget the oldest finished jobs beyond the history size."""
+        while len(self._jobs) > self._history:
+            oldest = next((jid for jid, j in self._jobs.items() if j.status in FINAL_STATES), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
+
+
+job_manager = JobManager()
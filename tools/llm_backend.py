@@ -0,0 +1,460 @@
+"""
+llm_backend.py
+--------------
+Pluggable backend behind the watsonx generate / embedding calls.
+Supports:
+ - watsonx: ModelInference / Embeddings, built on first use and rebuilt
+   (fresh IAM token) after an authentication error
+ - fake: local stand-in with latency distribution, token-limit errors and failures
+ - record: wraps another backend and appends every response to a JSONL file
+ - replay: answers from a recorded JSONL file (optionally falling back to fake)
+ - per-backend call counters and latencies for benchmarks
+Select with LLM_BACKEND=watsonx|fake|replay; LLM_RECORD_PATH records any backend.
+"""
+
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+LLM_BACKEND = os.getenv("LLM_BACKEND", "watsonx").lower()
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH", "")
+# Fake backend behaviour
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+# Sigma of the lognormal latency distribution (0 = constant latency)
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.4"))
+FAKE_EMBED_LATENCY_MS = float(os.getenv("FAKE_EMBED_LATENCY_MS", "150"))
+# Prompts longer than this many input tokens fail with a token-limit error
+FAKE_LLM_MAX_INPUT_TOKENS = int(os.getenv("FAKE_LLM_MAX_INPUT_TOKENS", "131072"))
+FAKE_LLM_CHARS_PER_TOKEN = float(os.getenv("FAKE_LLM_CHARS_PER_TOKEN", "3.5"))
+# Share of calls failing with a token-limit error / a generic error
+FAKE_LLM_TOKEN_ERROR_RATE = float(os.getenv("FAKE_LLM_TOKEN_ERROR_RATE", "0"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "42"))
+
+# Seconds before a failed watsonx client creation is attempted again
+WX_CLIENT_RETRY_SECONDS = float(os.getenv("WX_CLIENT_RETRY_SECONDS", "5"))
+# Error texts of expired / rejected IAM tokens
+_AUTH_ERROR_RE = re.compile(r"\b401\b|unauthori[sz]ed|token.{0,40}(expired|invalid)|authentication", re.IGNORECASE)
+
+FAKE_LABELS = ["Factuur", "Notulen", "Agenda", "Interne Memo", "Juridisch Contract", "Projectplanning"]
+
+_DOCUMENT_RE = re.compile(r"Document (\d+):\n")
+
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+class LLMBackend:
+    """Base class: counters shared by all backends."""
+
+    name = "base"
+
+    def __init__(self):
+        self.generate_calls = 0
+        self.prompts = 0
+        self.embed_calls = 0
+        self.errors = 0
+        self.latencies_ms = []
+        self._stats_lock = threading.Lock()
+
+    def generate(self, prompt: str, params: dict) -> dict:
+        return self._timed(lambda: self._generate(prompt, params), 1)
+
+    def generate_many(self, prompts: list, params: dict) -> list:
+        """One response per prompt, in order; a failed prompt yields its exception instead."""
+        results = self._timed(lambda: self._generate_many(prompts, params), len(prompts))
+        failed = sum(isinstance(result, Exception) for result in results)
+        if failed:
+            with self._stats_lock:
+                self.errors += failed
+        return results
+
+    def embed_documents(self, texts: list) -> list:
+        with self._stats_lock:
+            self.embed_calls += 1
+        return self._embed_documents(texts)
+
+    def _timed(self, call, prompt_count: int):
+        start = time.perf_counter()
+        try:
+            return call()
+        except Exception:
+            with self._stats_lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._stats_lock:
+                self.generate_calls += 1
+                self.prompts += prompt_count
+                self.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+    def _generate(self, prompt: str, params: dict) -> dict:
+        raise NotImplementedError
+
+    def _generate_many(self, prompts: list, params: dict) -> list:
+        results = []
+        for prompt in prompts:
+            try:
+                results.append(self._generate(prompt, params))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _embed_documents(self, texts: list) -> list:
+        raise NotImplementedError
+
+    def status(self) -> dict:
+        """Client state for readiness checks; never contacts the service."""
+        return {"backend": self.name, "configured": True}
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.generate_calls = self.prompts = self.embed_calls = self.errors = 0
+            self.latencies_ms = []
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies = list(self.latencies_ms)
+            return {
+                "backend": self.name,
+                "generate_calls": self.generate_calls,
+                "prompts": self.prompts,
+                "embed_calls": self.embed_calls,
+                "errors": self.errors,
+                "latency_p50_ms": round(_percentile(latencies, 50), 1),
+                "latency_p99_ms": round(_percentile(latencies, 99), 1),
+            }
+
+
+class WatsonxBackend(LLMBackend):
+    """
+    watsonx.ai ModelInference / Embeddings, created on first use and shared
+    by all threads. A call failing with an authentication error drops the
+    client and is retried once on a new one, which fetches a new IAM token.
+    Failed creations are not cached, so briefly missing credentials only
+    fail the calls made in the meantime.
+    """
+
+    name = "watsonx"
+
+    def __init__(self, model_id: str, embedding_model: str, embed_params: dict = None):
+        super().__init__()
+        self.model_id = model_id
+        self.embedding_model = embedding_model
+        self.embed_params = embed_params
+        self._clients = {}  # "model" | "embeddings" -> client
+        self._executor = None  # shared by all generate_many calls, created on first use
+        self._failed_at = {}  # kind -> time of the last failed creation
+        self.last_error = None
+        self.refreshes = 0
+        self._lock = threading.Lock()
+
+    def _credentials(self):
+        from ibm_watsonx_ai import Credentials
+        return Credentials(api_key=os.getenv("wx_api_key"), url=os.getenv("wx_service_url"))
+
+    def _create(self, kind: str):
+        from ibm_watsonx_ai.foundation_models import ModelInference, Embeddings
+        if kind == "model":
+            return ModelInference(
+                model_id=self.model_id,
+                credentials=self._credentials(),
+                project_id=os.getenv("wx_project_id")
+            )
+        return Embeddings(
+            model_id=self.embedding_model,
+            params=self.embed_params,
+            credentials=self._credentials(),
+            project_id=os.getenv("wx_project_id")
+        )
+
+    def _client(self, kind: str):
+        client = self._clients.get(kind)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(kind)
+            if client is not None:
+                return client
+            failed_at = self._failed_at.get(kind)
+            if failed_at is not None and time.monotonic() - failed_at < WX_CLIENT_RETRY_SECONDS:
+                raise RuntimeError(f"watsonx {kind} client unavailable: {self.last_error}")
+            try:
+                client = self._create(kind)
+            except Exception as e:
+                self._failed_at[kind] = time.monotonic()
+                self.last_error = str(e)
+                print(f"⚠️ watsonx {kind} client creation failed: {e}")
+                raise
+            self._failed_at.pop(kind, None)
+            self.last_error = None
+            self._clients[kind] = client
+            print(f"🔌 watsonx {kind} client ready")
+            return client
+
+    def _drop(self, kind: str, client):
+        with self._lock:
+            if self._clients.get(kind) is client:
+                del self._clients[kind]
+                self.refreshes += 1
+
+    def _call(self, kind: str, call):
+        client = self._client(kind)
+        try:
+            return call(client)
+        except Exception as e:
+            if not _AUTH_ERROR_RE.search(str(e)):
+                raise
+            print(f"🔑 watsonx {kind} authentication failed ({e}); refreshing client")
+            self._drop(kind, client)
+            return call(self._client(kind))
+
+    def model(self):
+        return self._client("model")
+
+    def embeddings(self):
+        return self._client("embeddings")
+
+    def _generate(self, prompt: str, params: dict) -> dict:
+        return self._call("model", lambda model: model.generate(prompt=prompt, params=params))
+
+    def _generate_many(self, prompts: list, params: dict) -> list:
+        # The service takes one prompt per request: a list is sent as
+        # concurrent requests (at most 10 over all batches), so a failing
+        # prompt does not fail the others of its batch
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=10, thread_name_prefix="wx-generate")
+        futures = [self._executor.submit(self._generate, prompt, params) for prompt in prompts]
+        return [future.exception() or future.result() for future in futures]
+
+    def _embed_documents(self, texts: list) -> list:
+        return self._call("embeddings", lambda embeddings: embeddings.embed_documents(texts=texts))
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                # Clients are created on first use; this only checks the settings
+                "configured": bool(os.getenv("wx_api_key") and os.getenv("wx_project_id")),
+                "clients": sorted(self._clients),
+                "refreshes": self.refreshes,
+                "last_error": self.last_error,
+            }
+
+
+class FakeBackend(LLMBackend):
+    """
+    Local stand-in for watsonx. A document is labeled with the first known
+    label named near its start, else with a label derived from a hash of the
+    text, so the same document always gets the same label.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms: float = FAKE_LLM_LATENCY_MS, latency_sigma: float = FAKE_LLM_LATENCY_SIGMA,
+                 embed_latency_ms: float = FAKE_EMBED_LATENCY_MS, max_input_tokens: int = FAKE_LLM_MAX_INPUT_TOKENS,
+                 chars_per_token: float = FAKE_LLM_CHARS_PER_TOKEN, token_error_rate: float = FAKE_LLM_TOKEN_ERROR_RATE,
+                 failure_rate: float = FAKE_LLM_FAILURE_RATE, labels: list = None, seed: int = FAKE_LLM_SEED):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.embed_latency_ms = embed_latency_ms
+        self.max_input_tokens = max_input_tokens
+        self.chars_per_token = chars_per_token
+        self.token_error_rate = token_error_rate
+        self.failure_rate = failure_rate
+        self.labels = labels or FAKE_LABELS
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _draw(self):
+        with self._random_lock:
+            return self._random.random(), self._random.lognormvariate(0, self.latency_sigma) if self.latency_sigma else 1.0
+
+    def _label_for(self, text: str) -> str:
+        head = text.strip()[:500].lower()
+        named = [(head.find(label.lower()), label) for label in self.labels if label.lower() in head]
+        if named:
+            return min(named)[1]
+        digest = hashlib.sha256(text.strip()[:200].encode("utf-8")).digest()
+        return self.labels[digest[0] % len(self.labels)]
+
+    def _generate(self, prompt: str, params: dict) -> dict:
+        roll, factor = self._draw()
+        time.sleep(self.latency_ms * factor / 1000.0)
+        input_tokens = int(len(prompt) / self.chars_per_token)
+        if input_tokens > self.max_input_tokens or roll < self.token_error_rate:
+            raise RuntimeError(
+                f"the number of input tokens {max(input_tokens, self.max_input_tokens + 1)} "
+                f"cannot exceed the total tokens limit {self.max_input_tokens}"
+            )
+        if roll < self.token_error_rate + self.failure_rate:
+            raise RuntimeError("Fake backend: simulated failure (503 Service Unavailable)")
+
+        documents = _DOCUMENT_RE.split(prompt)
+        if len(documents) > 2:
+            # Packed prompt: [head, "1", text1, "2", text2, ...]
+            answers = [
+                {"document": int(number), "label": self._label_for(text), "explanation": "Fake classificatie."}
+                for number, text in zip(documents[1::2], documents[2::2])
+            ]
+            generated_text = "```json\n" + json.dumps(answers, ensure_ascii=False) + "\n"
+        else:
+            snippet = prompt.split("Document Summary:", 1)[-1]
+            answer = {"label": self._label_for(snippet), "explanation": "Fake classificatie."}
+            generated_text = json.dumps(answer, ensure_ascii=False) + "\n"
+        return {"results": [{"generated_text": generated_text, "input_token_count": input_tokens}]}
+
+    def _generate_many(self, prompts: list, params: dict) -> list:
+        # The real endpoint serves the prompts of a batch concurrently
+        results = [None] * len(prompts)
+
+        def run(pos):
+            try:
+                results[pos] = self._generate(prompts[pos], params)
+            except Exception as e:
+                results[pos] = e
+
+        threads = [threading.Thread(target=run, args=(pos,)) for pos in range(len(prompts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _embed_documents(self, texts: list) -> list:
+        time.sleep(self.embed_latency_ms / 1000.0)
+        vectors = []
+        for text in texts:
+            digest = hashlib.sha256(text.lower().encode("utf-8")).digest()
+            vectors.append([b / 255.0 for b in digest[:16]])
+        return vectors
+
+
+class RecordingBackend(LLMBackend):
+    """Passes calls to another backend and appends every response to a JSONL file."""
+
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, path: str):
+        super().__init__()
+        self.inner = inner
+        self.path = path
+        self._file_lock = threading.Lock()
+
+    def status(self) -> dict:
+        return {**self.inner.status(), "recording": self.path}
+
+    def _record(self, kind: str, request, response):
+        line = json.dumps({"kind": kind, "key": request_key(kind, request), "response": response}, ensure_ascii=False)
+        with self._file_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def _generate(self, prompt: str, params: dict) -> dict:
+        response = self.inner.generate(prompt, params)
+        self._record("generate", [prompt, params], response)
+        return response
+
+    def _generate_many(self, prompts: list, params: dict) -> list:
+        responses = self.inner.generate_many(prompts, params)
+        for prompt, response in zip(prompts, responses):
+            if not isinstance(response, Exception):
+                self._record("generate", [prompt, params], response)
+        return responses
+
+    def _embed_documents(self, texts: list) -> list:
+        vectors = self.inner.embed_documents(texts)
+        for text, vector in zip(texts, vectors):
+            self._record("embed", text, vector)
+        return vectors
+
+
+class ReplayBackend(LLMBackend):
+    """Answers from a recorded JSONL file; unknown requests go to fallback or fail."""
+
+    name = "replay"
+
+    def __init__(self, path: str, fallback: LLMBackend = None):
+        super().__init__()
+        self.path = path
+        self.fallback = fallback
+        self.replayed = 0
+        self.missed = 0
+        self._responses = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._responses[entry["key"]] = entry["response"]
+        print(f"📼 Replay backend loaded {len(self._responses)} responses from {path}")
+
+    def _lookup(self, kind: str, request, fallback_call):
+        key = request_key(kind, request)
+        if key in self._responses:
+            with self._stats_lock:
+                self.replayed += 1
+            return self._responses[key]
+        with self._stats_lock:
+            self.missed += 1
+        if self.fallback is None:
+            raise KeyError(f"No recorded {kind} response for this request")
+        return fallback_call()
+
+    def _generate(self, prompt: str, params: dict) -> dict:
+        return self._lookup("generate", [prompt, params], lambda: self.fallback.generate(prompt, params))
+
+    def _embed_documents(self, texts: list) -> list:
+        return [
+            self._lookup("embed", text, lambda text=text: self.fallback.embed_documents([text])[0])
+            for text in texts
+        ]
+
+    def stats(self) -> dict:
+        data = super().stats()
+        with self._stats_lock:
+            data.update({"replayed": self.replayed, "missed": self.missed})
+        return data
+
+
+def request_key(kind: str, request) -> str:
+    return hashlib.sha256(json.dumps([kind, request], sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def create_backend(name: str, model_id: str, embedding_model: str, embed_params: dict = None) -> LLMBackend:
+    """Build the configured backend (plus recording wrapper when LLM_RECORD_PATH is set)."""
+    if name == "fake":
+        backend = FakeBackend()
+    elif name == "replay":
+        if not LLM_REPLAY_PATH:
+            raise ValueError("LLM_BACKEND=replay requires LLM_REPLAY_PATH")
+        fallback = FakeBackend() if os.getenv("LLM_REPLAY_FALLBACK", "").lower() == "fake" else None
+        backend = ReplayBackend(LLM_REPLAY_PATH, fallback)
+    elif name == "watsonx":
+        backend = WatsonxBackend(model_id, embedding_model, embed_params)
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND '{name}' (use watsonx, fake or replay)")
+    if LLM_RECORD_PATH:
+        backend = RecordingBackend(backend, LLM_RECORD_PATH)
+    print(f"🔌 LLM backend: {backend.name}")
+    return backend
@@ -0,0 +1,146 @@
+"""
+llm_batcher.py
+--------------
+Micro-batching of LLM generate calls.
+Supports:
+ - many threads submitting single prompts
+ - one background thread grouping up to LLM_BATCH_SIZE prompts per generate_many call
+ - max wait before a partial batch is sent
+ - a bounded pool of LLM_BATCH_MAX_INFLIGHT batches in flight
+ - per-prompt results: a failed prompt only fails its own caller, and a
+   failing batch call falls back to single prompts
+Off by default: the watsonx backend still sends one request per prompt, so
+grouping only pays off for backends that serve a list of prompts in one call.
+"""
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+# Prompts per generate_many call (1 = no batching, every caller calls generate itself)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+# How long the first prompt of a batch waits for others to join
+LLM_BATCH_MAX_WAIT_MS = int(os.getenv("LLM_BATCH_MAX_WAIT_MS", "50"))
+# Batches sent concurrently; further batches wait in the pool's queue
+LLM_BATCH_MAX_INFLIGHT = int(os.getenv("LLM_BATCH_MAX_INFLIGHT", "4"))
+
+
+class PromptBatcher:
+    """
+    Collects prompts from concurrent callers and sends them together.
+    generate_many(prompts) must return one response per prompt, in order, with
+    the exception in place of a failed prompt's response; generate_one(prompt)
+    is used when a whole batch call fails.
+    """
+
+    def __init__(self, generate_many, generate_one, batch_size: int = LLM_BATCH_SIZE,
+                 max_wait_ms: int = LLM_BATCH_MAX_WAIT_MS, max_inflight: int = LLM_BATCH_MAX_INFLIGHT):
+        self.generate_many = generate_many
+        self.generate_one = generate_one
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_inflight = max(1, max_inflight)
+        self.batches = 0
+        self.prompts = 0
+        self.fallbacks = 0
+        self.failed_prompts = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.batch_size > 1
+
+    def generate(self, prompt: str):
+        """Blocking call returning the response for one prompt."""
+        if not self.enabled:
+            return self.generate_one(prompt)
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((prompt, future))
+        return future.result()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_inflight,
+                                                        thread_name_prefix="llm-batch")
+                    self._thread = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # Wait briefly for more prompts, but never beyond max_wait
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Keep the loop free for the next batch while this one is in flight
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch: list):
+        prompts = [prompt for prompt, _ in batch]
+        with self._lock:
+            self.batches += 1
+            self.prompts += len(prompts)
+        if len(batch) == 1:
+            self._send_single(*batch[0])
+            return
+        try:
+            responses = self.generate_many(prompts)
+            if len(responses) != len(prompts):
+                raise ValueError(f"Batch returned {len(responses)} responses for {len(prompts)} prompts")
+        except Exception as e:
+            print(f"⚠️ Batched generate failed ({e}); falling back to single prompts")
+            with self._lock:
+                self.fallbacks += 1
+            for prompt, future in batch:
+                self._send_single(prompt, future)
+            return
+        failed = 0
+        for (_, future), response in zip(batch, responses):
+            if isinstance(response, Exception):
+                failed += 1
+                future.set_exception(response)
+            else:
+                future.set_result(response)
+        if failed:
+            with self._lock:
+                self.failed_prompts += failed
+
+    def _send_single(self, prompt: str, future: Future):
+        try:
+            future.set_result(self.generate_one(prompt))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "batch_size": self.batch_size,
+                "max_wait_ms": int(self.max_wait * 1000),
+                "max_inflight": self.max_inflight,
+                "batches": self.batches,
+                "prompts": self.prompts,
+                "avg_batch_size": round(self.prompts / self.batches, 2) if self.batches else 0.0,
+                "fallbacks": self.fallbacks,
+                "failed_prompts": self.failed_prompts,
+                "queued": self._queue.qsize(),
+            }
@@ -0,0 +1,203 @@
+"""
+metrics.py
+----------
+In-process metrics in the Prometheus text exposition format.
+Supports:
+ - counters and histograms with labels
+ - collectors that report gauges computed at scrape time (cache sizes, ...)
+ - the per-stage metrics of the labeling pipeline, shared by all modules
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(labelnames, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonic counter per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Cumulative bucket histogram (seconds by default) per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0
+
+    def render(self) -> list:
+        with self._lock:
+            series_items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self.header()
+        for key, series in sorted(series_items):
+            for bound, cumulative in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, {'le': '+Inf'})} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds all metrics of the process.
+    Collectors are callables returning [(name, documentation, [(labels dict, value)])]
+    and are rendered as gauges on every scrape.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                print(f"⚠️ Metrics collector failed: {e}")
+                continue
+            for name, documentation, samples in gauges:
+                lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"])
+                for labels, value in samples:
+                    names = tuple(labels)
+                    lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# -----------------------------------------------------------------
+# PIPELINE METRICS
+# -----------------------------------------------------------------
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "API request latency by route.", ("method", "route", "status"))
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "MySQL statement latency (db_execute / db_execute_write).", ("operation", "outcome"))
+LLM_CALL_SECONDS = registry.histogram(
+    "llm_call_duration_seconds", "LLM generate latency per classification call, incl. batch wait.", ("mode", "outcome"))
+LLM_TOKEN_LIMIT_RETRIES = registry.counter(
+    "llm_token_limit_retries_total", "LLM calls retried with a smaller snippet after a token-limit error.")
+LLM_TOKEN_LIMIT_FAILURES = registry.counter(
+    "llm_token_limit_failures_total", "Documents given up after token-limit errors.")
+DOCUMENT_CLASSIFICATIONS = registry.counter(
+    "document_classifications_total", "Document classifications by where the answer came from.", ("source",))
+EMBEDDING_CALL_SECONDS = registry.histogram(
+    "embedding_call_duration_seconds", "Label embedding call latency (cache misses only).")
+LABEL_WRITE_SECONDS = registry.histogram(
+    "label_write_duration_seconds", "Cluster label write latency by target.", ("target",))
+CLUSTER_INFERENCE_SECONDS = registry.histogram(
+    "cluster_inference_duration_seconds", "infer_cluster_label latency per cluster.", (),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0))
+CLUSTER_LABELS = registry.counter(
+    "cluster_labels_total", "Labeled clusters by outcome (Auto / Auto-Similar / Manual / ...).", ("status",))
@@ -0,0 +1,194 @@
+"""
+token_budget.py
+---------------
+Up-front token budgeting for LLM prompts.
+Supports:
+ - per-model input token limit (env, known model defaults, or learned from
+   token-limit errors and persisted in the cache DB across restarts)
+ - chars-per-token estimate calibrated from input_token_count of past responses
+ - trimming a snippet so the first request already fits
+ - counters for trims, token-limit retries and failures
+"""
+
+import os
+import re
+import threading
+from dotenv import load_dotenv
+from tools.cache_utils import SQLiteCache, CACHE_DB_PATH
+
+# ---------- LOAD ENV ----------
+load_dotenv()
+
+# ---------- CONFIG ----------
+# Max input tokens of the model; overrides the defaults below (0 = use defaults / learned limit)
+LLM_MAX_INPUT_TOKENS = int(os.getenv("LLM_MAX_INPUT_TOKENS", "0"))
+# Keep learned limits and chars/token in the cache DB so restarts don't relearn them
+TOKEN_BUDGET_PERSIST = os.getenv("TOKEN_BUDGET_PERSIST", "true").lower() == "true"
+# Starting estimate before any response was observed (Dutch text is ~3-4 chars/token)
+LLM_CHARS_PER_TOKEN = float(os.getenv("LLM_CHARS_PER_TOKEN", "3.0"))
+# Fraction of the computed budget actually used, to absorb estimate noise
+TOKEN_BUDGET_SAFETY = float(os.getenv("TOKEN_BUDGET_SAFETY", "0.9"))
+
+# e.g. "the number of input tokens 140213 cannot exceed the total tokens limit 131072"
+# Context windows of models used with this service, so the first request already fits
+MODEL_MAX_INPUT_TOKENS = {
+    "mistralai/mistral-medium-2505": 131072,
+    "mistralai/mistral-small-3-1-24b-instruct-2503": 131072,
+    "mistralai/mixtral-8x7b-instruct-v01": 32768,
+    "meta-llama/llama-3-3-70b-instruct": 131072,
+    "ibm/granite-3-8b-instruct": 131072,
+    "ibm/granite-3-3-8b-instruct": 131072,
+}
+# Calibration is saved every this many observations
+_PERSIST_EVERY = 50
+
+_INPUT_TOKENS_RE = re.compile(r"input tokens\D{0,20}(\d+)", re.IGNORECASE)
+_LIMIT_RE = re.compile(r"(?:limit|maximum)\D{0,40}(\d+)", re.IGNORECASE)
+
+
+def is_token_limit_error(error_msg: str) -> bool:
+    msg = error_msg.lower()
+    return "token" in msg or "input tokens" in msg or "exceed" in msg
+
+
+class TokenBudget:
+    """Token budget of one model; shared by all threads calling it."""
+
+    def __init__(self, model_id: str, max_input_tokens: int = LLM_MAX_INPUT_TOKENS,
+                 chars_per_token: float = LLM_CHARS_PER_TOKEN, max_new_tokens: int = 0, store=None):
+        self.model_id = model_id
+        self.max_input_tokens = max_input_tokens or None
+        self.chars_per_token = chars_per_token
+        self.max_new_tokens = max_new_tokens
+        self.store = store
+        self.limit_source = "env" if max_input_tokens else None
+        self.observations = 0
+        self.requests = 0
+        self.trimmed = 0
+        self.token_retries = 0
+        self.token_failures = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Start from the persisted state of an earlier process, else the model default."""
+        saved = self.store.get(self.model_id) if self.store is not None else None
+        if saved:
+            self.chars_per_token = saved.get("chars_per_token") or self.chars_per_token
+            if not self.max_input_tokens and saved.get("max_input_tokens"):
+                self.max_input_tokens = saved["max_input_tokens"]
+                self.limit_source = "learned"
+        if not self.max_input_tokens and self.model_id in MODEL_MAX_INPUT_TOKENS:
+            self.max_input_tokens = MODEL_MAX_INPUT_TOKENS[self.model_id]
+            self.limit_source = "default"
+
+    def _save(self):
+        """Persist the learned limit and calibration (caller holds the lock)."""
+        if self.store is None:
+            return
+        self.store.put(self.model_id, {
+            "max_input_tokens": self.max_input_tokens if self.limit_source == "learned" else None,
+            "chars_per_token": self.chars_per_token,
+        })
+
+    def fit(self, snippet: str, overhead_chars: int) -> str:
+        """Trim snippet so prompt overhead + snippet fit the input budget."""
+        with self._lock:
+            self.requests += 1
+            max_chars = self._max_snippet_chars(overhead_chars)
+            if max_chars is None or len(snippet) <= max_chars:
+                return snippet
+            self.trimmed += 1
+        print(f"✂️ Token budget: trimming snippet {len(snippet)} → {max_chars} chars")
+        return snippet[:max_chars]
+
+    def snippet_chars(self, overhead_chars: int, new_tokens: int = None):
+        """
+        Max snippet chars next to overhead_chars of prompt (None = no known limit).
+        new_tokens: answer tokens to reserve, if not max_new_tokens (packed prompts).
+        """
+        with self._lock:
+            return self._max_snippet_chars(overhead_chars, new_tokens)
+
+    def _max_snippet_chars(self, overhead_chars: int, new_tokens: int = None):
+        if not self.max_input_tokens:
+            return None
+        new_tokens = self.max_new_tokens if new_tokens is None else new_tokens
+        budget_tokens = (self.max_input_tokens - new_tokens) * TOKEN_BUDGET_SAFETY
+        budget_chars = int(budget_tokens * self.chars_per_token) - overhead_chars
+        return max(budget_chars, 0)
+
+    def observe(self, prompt_chars: int, input_tokens):
+        """Calibrate chars/token from a successful call's input_token_count."""
+        if not input_tokens or not prompt_chars:
+            return
+        ratio = prompt_chars / float(input_tokens)
+        with self._lock:
+            self.observations += 1
+            # Running mean first, then an EMA so the estimate follows the data
+            weight = max(1.0 / self.observations, 0.1)
+            self.chars_per_token += (ratio - self.chars_per_token) * weight
+            if self.observations % _PERSIST_EVERY == 0:
+                self._save()
+
+    def observe_limit_error(self, error_msg: str, prompt_chars: int) -> bool:
+        """
+        Learn from a token-limit error: the reported input token count
+        calibrates chars/token, the reported limit sets max_input_tokens.
+        Returns True when the budget could be updated.
+        """
+        with self._lock:
+            self.token_retries += 1
+        learned = False
+        tokens = _INPUT_TOKENS_RE.search(error_msg)
+        if tokens:
+            self.observe(prompt_chars, int(tokens.group(1)))
+            learned = True
+        limit = _LIMIT_RE.search(error_msg[tokens.end():] if tokens else error_msg)
+        if limit:
+            with self._lock:
+                reported = int(limit.group(1))
+                plausible = reported > self.max_new_tokens
+                if plausible and (not self.max_input_tokens or reported < self.max_input_tokens):
+                    self.max_input_tokens = reported
+                    self.limit_source = "learned"
+                    self._save()
+                    print(f"📏 Token budget for {self.model_id}: max_input_tokens={reported}")
+            learned = True
+        return learned
+
+    def record_failure(self):
+        with self._lock:
+            self.token_failures += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model_id": self.model_id,
+                "max_input_tokens": self.max_input_tokens,
+                "limit_source": self.limit_source,
+                "chars_per_token": round(self.chars_per_token, 3),
+                "observations": self.observations,
+                "requests": self.requests,
+                "trimmed_up_front": self.trimmed,
+                "token_limit_retries": self.token_retries,
+                "token_limit_failures": self.token_failures,
+            }
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+_budget_store = SQLiteCache(CACHE_DB_PATH, "token_budgets", 1000, TOKEN_BUDGET_PERSIST)
+
+
+def get_token_budget(model_id: str, max_new_tokens: int = 0) -> TokenBudget:
+    """Shared budget per model id."""
+    with _budgets_lock:
+        if model_id not in _budgets:
+            _budgets[model_id] = TokenBudget(model_id, max_new_tokens=max_new_tokens, store=_budget_store)
+        return _budgets[model_id]
+
+
+def token_budget_stats() -> list:
+    with _budgets_lock:
+        return [budget.stats() for budget in _budgets.values()]
@@ -1,10 +1,10 @@
 
 from dotenv import load_dotenv
-import re,os,json,numpy as np
-from ibm_watsonx_ai import Credentials
-from ibm_watsonx_ai.foundation_models import ModelInference,Embeddings
-from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams,EmbedTextParamsMetaNames as EmbedParams
-from ibm_watsonx_ai.foundation_models.utils.enums import ModelTypes, DecodingMethods,EmbeddingTypes
+import re,os,json,time,numpy as np
+from tools.token_budget import get_token_budget
+from tools.llm_batcher import PromptBatcher
+from tools.llm_backend import LLM_BACKEND,create_backend
+from tools.metrics import LLM_CALL_SECONDS
 
 
 # Load environment variables from .env file (if using dotenv for environment variables)
@@ -16,21 +16,27 @@ wx_project_id = os.getenv('wx_project_id')
 wx_llm_model_id = os.getenv('wx_llm_model_id', 'mistralai/mistral-medium-2505')  # Default value in case ENV is missing
 wx_embedding_model=os.getenv('wx_embedding_model','ibm/slate-125m-english-rtrvr')
 
-# To display example params enter # print(GenParams().get_example_values())
+# Parameter names of ibm_watsonx_ai GenTextParamsMetaNames / EmbedTextParamsMetaNames.
+# Plain strings, so importing this module does not load the SDK (it is loaded
+# when the first watsonx client is created).
+class GenParams:
+    DECODING_METHOD = "decoding_method"
+    MAX_NEW_TOKENS = "max_new_tokens"
+    STOP_SEQUENCES = "stop_sequences"
+
+class EmbedParams:
+    TRUNCATE_INPUT_TOKENS = "truncate_input_tokens"
+    RETURN_OPTIONS = "return_options"
+
+# To display example params enter # print(GenTextParamsMetaNames().get_example_values())
 generate_params = {
     GenParams.DECODING_METHOD:'greedy',
     GenParams.MAX_NEW_TOKENS: 250,
     GenParams.STOP_SEQUENCES:["}\n"]
 }
 
-model_inference = ModelInference(
-    # model_id=ModelTypes.GRANITE_20B_MULTILINGUAL,
-    model_id=wx_llm_model_id, # Using utils: ModelTypes.MIXTRAL_8X7B_INSTRUCT_V01
-    credentials=Credentials(
-        api_key = wx_api_key,
-        url = wx_service_url),
-        project_id=wx_project_id
-    )
+# Calibrated from input_token_count of every response
+token_budget = get_token_budget(wx_llm_model_id, generate_params[GenParams.MAX_NEW_TOKENS])
 
 # Embedding Params:
 embed_params = {
@@ -38,15 +44,12 @@ embed_params = {
     EmbedParams.RETURN_OPTIONS: {"input_text": False}
 }
 
-wx_embeddings = Embeddings(
-    model_id=wx_embedding_model,
-    params=embed_params,
-    credentials=Credentials(api_key=wx_api_key, url=wx_service_url),
-    project_id=wx_project_id
-)
+# watsonx (default), fake or replay; see tools/llm_backend.py
+llm_backend = create_backend(LLM_BACKEND, wx_llm_model_id, wx_embedding_model, embed_params)
+# Same embed_documents(texts=...) interface as watsonx Embeddings
+wx_embeddings = llm_backend
 
-def inference_llm_dutch(context_passages):
-    llm_instr = """
+DUTCH_PROMPT_TEMPLATE = """
             <s>[INST] <<SYS>>
             Je bent een uiterst capabele AI-assistent die documenten in meerdere talen intelligent classificeert. In deze taak analyseer je de verstrekte inhoud van een document en bepaal je het **meest geschikte enkele label** dat het type document het best beschrijft.
 
@@ -81,15 +84,83 @@ def inference_llm_dutch(context_passages):
 
             Wat is het meest geschikte label voor dit document? [/INST] """
 
-    formatted_prompt = llm_instr.format(doc_snippet=context_passages)
-    generated_response = model_inference.generate(prompt=formatted_prompt, params=generate_params)
+# Packed mode: several documents of one cluster in one prompt, answered as a JSON array.
+# Shares the classification guidelines of DUTCH_PROMPT_TEMPLATE.
+PACKED_DUTCH_PROMPT_TEMPLATE = DUTCH_PROMPT_TEMPLATE.split("### Antwoordformaat")[0] + """### Antwoordformaat (Moet een geldige JSON-array zijn in dezelfde taal als de documenten):
+            Je krijgt {doc_count} documenten. Classificeer elk document afzonderlijk en geef precies één object per document, in dezelfde volgorde:
+            ```json
+            [
+            {{"document": 1, "label": "<Meest geschikte enkele label voor document 1>", "explanation": "<Korte uitleg>"}},
+            {{"document": 2, "label": "<Meest geschikte enkele label voor document 2>", "explanation": "<Korte uitleg>"}}
+            ]
+            ```
+            Voeg niets toe buiten deze JSON-array.
+            <</SYS>>
+
+            {documents}
+
+            Wat is het meest geschikte label voor elk van deze {doc_count} documenten? [/INST] """
+
+def packed_generate_params(doc_count):
+    # Room for one answer per document; "}\n" would stop after the first object
+    return {
+        **generate_params,
+        GenParams.MAX_NEW_TOKENS: generate_params[GenParams.MAX_NEW_TOKENS] * doc_count,
+        GenParams.STOP_SEQUENCES: ["]\n"],
+    }
+
+def _generate_one(prompt):
+    return llm_backend.generate(prompt, generate_params)
+
+def _generate_many(prompts):
+    return llm_backend.generate_many(prompts, generate_params)
+
+# Groups prompts of concurrently processed documents and clusters (LLM_BATCH_SIZE > 1)
+prompt_batcher = PromptBatcher(_generate_many, _generate_one)
+
+def _timed_generate(mode, generate, *args):
+    """Run one generate call and record its latency and outcome."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        response = generate(*args)
+        outcome = "ok"
+        return response
+    finally:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, mode=mode, outcome=outcome)
+
+def inference_llm_dutch(context_passages):
+    formatted_prompt = DUTCH_PROMPT_TEMPLATE.format(doc_snippet=context_passages)
+    generated_response = _timed_generate("single", prompt_batcher.generate, formatted_prompt)
     llm_response = generated_response['results'][0]['generated_text']
+    token_budget.observe(len(formatted_prompt), generated_response['results'][0].get('input_token_count'))
     
     llm_json_response = extract_json(llm_response)
     print("llm_json_response")
     print(llm_json_response)
     return llm_json_response
 
+def inference_llm_dutch_packed(snippets):
+    """
+    Classify several documents in one call.
+    Returns a list of {label, explanation} in snippet order, or None when the
+    answer cannot be mapped back to the documents.
+    """
+    documents = "\n\n".join(f"Document {i}:\n{snippet}" for i, snippet in enumerate(snippets, start=1))
+    formatted_prompt = PACKED_DUTCH_PROMPT_TEMPLATE.format(doc_count=len(snippets), documents=documents)
+    generated_response = _timed_generate("packed", llm_backend.generate, formatted_prompt, packed_generate_params(len(snippets)))
+    llm_response = generated_response['results'][0]['generated_text']
+    token_budget.observe(len(formatted_prompt), generated_response['results'][0].get('input_token_count'))
+
+    items = extract_json(llm_response, as_list=True)
+    if not isinstance(items, list) or len(items) != len(snippets):
+        return None
+    if not all(isinstance(item, dict) and "label" in item for item in items):
+        return None
+    if all(isinstance(item.get("document"), int) for item in items):
+        items = sorted(items, key=lambda item: item["document"])
+    return items
+
 def inference_llm(context_passages):
     llm_instr = """
     <s>[INST] <<SYS>>
@@ -126,18 +197,23 @@ def inference_llm(context_passages):
     """
 
     formatted_prompt = llm_instr.format(doc_snippet=context_passages)
-    generated_response = model_inference.generate(prompt=formatted_prompt, params=generate_params)
+    generated_response = llm_backend.generate(formatted_prompt, generate_params)
     llm_response = generated_response['results'][0]['generated_text']
     llm_json_response = extract_json(llm_response)
     return llm_json_response
 
-def extract_json(output_text):
-    """Extract JSON object from LLM output."""
-    json_match = re.search(r'\{.*?\}|\[.*?\]', output_text, re.DOTALL)
+def extract_json(output_text, as_list=False):
+    """Extract JSON object from LLM output (as_list: the whole JSON array)."""
+    if as_list:
+        json_match = re.search(r'\[.*\]', output_text, re.DOTALL)
+    else:
+        json_match = re.search(r'\{.*?\}|\[.*?\]', output_text, re.DOTALL)
     
     if json_match:
         try:
             json_object = json.loads(json_match.group(0))
+            if as_list:
+                return json_object if isinstance(json_object, list) else [json_object]
             if isinstance(json_object, list) and len(json_object) > 0:
                 return json_object[0]  # Return first element if list
             return json_object  # Otherwise, return dictionary